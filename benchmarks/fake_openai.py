@@ -0,0 +1,97 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions after --latency seconds with a fixed text and a
+usage block, and returns 429 when more than --rpm requests arrive within a minute.
+Point the bot at it with OPENAI_BASE_URL:
+
+    python benchmarks/fake_openai.py --port 8089 --latency 2 &
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python src/cli.py narratives --start 2025-01-01
+"""
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    latency = 1.0
+    rpm = 0
+    _recent = deque()
+    _lock = threading.Lock()
+    # Время (time.monotonic()) каждого принятого запроса
+    accepted = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._reply(404, {"error": {"message": "not found"}})
+            return
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            limited = self.rpm and len(self._recent) >= self.rpm
+            if not limited:
+                self._recent.append(now)
+                self.accepted.append(now)
+        if limited:
+            self._reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"Retry-After": "1"})
+            return
+        time.sleep(self.latency)
+        prompt_tokens = sum(len(str(message.get("content", ""))) // 3 for message in request.get("messages", []))
+        self._reply(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "Синтетический вывод по итогам дня."}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 12, "total_tokens": prompt_tokens + 12},
+        })
+
+
+def start_server(port=0, latency=1.0, rpm=0):
+    """Starts the fake server on a daemon thread and returns it (server.server_address has the port).
+
+    Each server has its own rate window; server.RequestHandlerClass.accepted lists its accepted requests.
+    """
+    handler = type("FakeOpenAIHandler", (FakeOpenAIHandler,), {
+        "latency": latency, "rpm": rpm, "_recent": deque(), "_lock": threading.Lock(), "accepted": [],
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per completion")
+    parser.add_argument("--rpm", type=int, default=0, help="answer 429 above this many requests per minute (0: no limit)")
+    args = parser.parse_args()
+    server = start_server(args.port, args.latency, args.rpm)
+    print(f"Fake OpenAI API on http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
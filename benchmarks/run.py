@@ -0,0 +1,203 @@
+"""Benchmarks the report pipeline on synthetic exports.
+
+Stages: parse (CSV -> typed deal frame), metrics (Process.* for one day),
+report (send_report_day with stubbed Telegram/OpenAI), backfill
+(Process.calculate_daily_metrics) and persistence (CumulativeStore.upsert).
+
+    python benchmarks/run.py --rows 10000 100000 --save local
+    python benchmarks/run.py --rows 10000 100000 --compare local --tolerance 0.3
+"""
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+
+import pandas as pd  # noqa: E402
+import bot  # noqa: E402
+import config  # noqa: E402
+import dataset  # noqa: E402
+import storage  # noqa: E402
+import llm_cache  # noqa: E402
+import subscribers  # noqa: E402
+import deal_history  # noqa: E402
+from process_csv import Process  # noqa: E402
+from ingest import coerce_export_types  # noqa: E402
+from synthetic_export import write_export  # noqa: E402
+
+BASELINE_DIR = os.path.join(HERE, "baselines")
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+class FakeOpenAI:
+    """Answers every chat completion instantly with a fixed text."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        message = SimpleNamespace(content="Вывод: синтетический ответ.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def measure(function, track_memory=True, repeat=1):
+    """Runs `function` and returns (result, seconds, peak MiB of Python allocations).
+
+    seconds is the best of `repeat` runs: short stages that hit the disk vary by tens of percent.
+    """
+    seconds = None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    peak = None
+    if track_memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_size(rows, workdir, track_memory=True, repeat=1):
+    csv_path = os.path.join(workdir, f"export_{rows}.csv")
+    snapshot_path = os.path.join(workdir, f"snapshot_{rows}.parquet")
+    write_export(csv_path, rows, end=datetime.now() - timedelta(hours=1))
+    stages = {}
+
+    def record(name, function):
+        result, seconds, peak = measure(function, track_memory, repeat)
+        stages[name] = {"seconds": round(seconds, 4), "peak_mib": None if peak is None else round(peak, 2)}
+        return result
+
+    deals = record("parse", lambda: Process.load_deal_frame(Process.read_csv_file(csv_path)))
+
+    yesterday = pd.Timestamp(datetime.now() - timedelta(days=1)).normalize()
+    day = deals[(deals["date"] == yesterday) & (deals["responsible_user_id"] != "Биржа заявок")]
+    record("metrics", lambda: (
+        Process.calculate_total_revenue(day),
+        Process.calculate_revenue_per_employee(day),
+        Process.count_deal_stages(day),
+        Process.calculate_employee_activity(day),
+    ))
+
+    coerce_export_types(Process.read_csv_file(csv_path)).to_parquet(snapshot_path, index=False)
+    store = storage.CumulativeStore(os.path.join(workdir, f"report_{rows}.db"), legacy_json=None)
+    storage._store = store
+    fake_bot = FakeBot()
+    bot._bot = fake_bot
+    bot.get_chat_id = lambda: 1
+    subscribers._registry = subscribers.SubscriberRegistry(os.path.join(workdir, "subscribers.db"))
+    bot.download_and_convert_xlsx = lambda: True
+    config._openai_client = FakeOpenAI()
+
+    def send_report():
+        # Каждый прогон начинается с одного состояния: чекпоинт сброшен (иначе send_report_day
+        # вышел бы сразу), история сделок и кэш LLM пустые. История отчётов считается полной,
+        # чтобы этап report не включал догрузку пропущенных дней
+        with store._connect() as conn:
+            conn.execute("DELETE FROM meta WHERE key = 'last_completed'")
+        store.mark_completed((yesterday - timedelta(days=1)).strftime("%Y-%m-%d"))
+        run_dir = tempfile.mkdtemp(dir=workdir)
+        deal_history._history = deal_history.DealHistory(os.path.join(run_dir, "deal_history"))
+        llm_cache._cache = llm_cache.LLMCache(os.path.join(run_dir, "llm_cache.db"))
+        dataset._dataset = dataset.Dataset(store, snapshot_path)
+        sent = len(fake_bot.sent)
+        bot.send_report_day()
+        assert len(fake_bot.sent) > sent, "report stage did not send the report"
+
+    record("report", send_report)
+    entries = record("backfill", lambda: Process.calculate_daily_metrics(deals))
+    record("persistence", lambda: store.upsert(entries))
+    return stages
+
+
+def compare(results, baseline, tolerance):
+    """Returns regressions: stages slower (or bigger) than baseline by more than `tolerance`."""
+    regressions = []
+    for rows, stages in results.items():
+        for stage, values in stages.items():
+            base = baseline.get("results", {}).get(rows, {}).get(stage)
+            if not base:
+                continue
+            for metric in ("seconds", "peak_mib"):
+                if values.get(metric) is None or not base.get(metric):
+                    continue
+                ratio = values[metric] / base[metric]
+                if ratio > 1 + tolerance:
+                    regressions.append(f"{rows} rows / {stage} / {metric}: {base[metric]} -> {values[metric]} (x{ratio:.2f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--no-memory", action="store_true", help="skip the second, traced run of each stage")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one is kept")
+    parser.add_argument("--output", help="write results JSON to this path")
+    parser.add_argument("--save", metavar="NAME", help="save results as baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.rows:
+            results[str(rows)] = run_size(rows, workdir, not args.no_memory, args.repeat)
+            print(f"{rows} rows: " + ", ".join(
+                f"{stage} {values['seconds']:.3f}s" + (f"/{values['peak_mib']:.1f}MiB" if values["peak_mib"] is not None else "")
+                for stage, values in results[str(rows)].items()
+            ))
+
+    output = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.platform(),
+        "results": results,
+    }
+    paths = [args.output] if args.output else []
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        paths.append(os.path.join(BASELINE_DIR, f"{args.save}.json"))
+    for path in paths:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=4, ensure_ascii=False)
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
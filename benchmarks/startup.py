@@ -0,0 +1,68 @@
+"""Measures process startup for the CLI subcommands.
+
+Each case runs in a fresh interpreter (median of --runs) and lists which heavy
+modules (pandas, numpy, openai, telebot) it ended up importing.
+
+    python benchmarks/startup.py --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.abspath(os.path.join(HERE, "..", "src"))
+HEAVY_MODULES = ("pandas", "numpy", "openai", "telebot")
+
+CASES = {
+    "cli --help": "import cli\ntry:\n    cli.main(['--help'])\nexcept SystemExit:\n    pass",
+    "query (local answer)": "import cli\ncli.main(['query', 'выручка за вчера', '--no-llm'])",
+    "backfill/report imports": "import bot",
+    "serve imports": "import bot\nbot.get_bot()\nbot.get_openai_client()",
+}
+
+
+def run_case(code, workdir):
+    """Runs `code` in a new interpreter; returns (seconds, heavy modules it imported)."""
+    script = (
+        f"import sys\nsys.path.insert(0, {SRC!r})\n{code}\n"
+        f"print('HEAVY=' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    env = dict(os.environ, OPENAI_API_KEY="startup", BOT_TOKEN="0:startup")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", script], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True)
+    seconds = time.perf_counter() - start
+    heavy = next((line[6:] for line in result.stdout.splitlines() if line.startswith("HEAVY=")), "")
+    return seconds, [name for name in heavy.split(",") if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write results JSON to this path")
+    args = parser.parse_args()
+
+    results = {}
+    # Пустой рабочий каталог: data/ создаётся заново, реальная история не читается
+    with tempfile.TemporaryDirectory() as workdir:
+        run_case("pass", workdir)  # прогрев кэша байткода
+        for name, code in CASES.items():
+            timings = []
+            for _ in range(args.runs):
+                seconds, heavy = run_case(code, workdir)
+                timings.append(seconds)
+            results[name] = {"seconds": round(statistics.median(timings), 3), "heavy_modules": heavy}
+            print(f"{name}: {results[name]['seconds']:.3f}s, imports {', '.join(heavy) or 'no heavy modules'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
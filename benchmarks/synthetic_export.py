@@ -0,0 +1,70 @@
+"""Synthetic amoCRM exports in the real schema, for benchmarks.
+
+    python benchmarks/synthetic_export.py 1000000 data/synthetic.csv
+"""
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from config import DEAL_STATUSES  # noqa: E402
+
+EMPLOYEES = ["Сергачев Александр", "Сериков Данат", "Ахметова Айгерим", "Ким Виктор", "Иванова Ольга"]
+EXCHANGE = "Биржа заявок"
+COLUMNS = ["id", "name", "price", "status_id", "responsible_user_id", "created_at", "updated_at", "closed_at"]
+
+
+def generate_export(rows, days=90, end=None, seed=0, first_id=30_000_000):
+    """Returns `rows` deals updated during the `days` days before `end` (default: now).
+
+    Prices use comma thousands separators (some are empty), ~15% of deals sit on
+    "Биржа заявок", dates are 'DD.MM.YYYY HH:MM:SS' and open deals have closed_at "не закрыта".
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or pd.Timestamp.now()).floor("s")
+    statuses = sorted(status for group in DEAL_STATUSES.values() for status in group)
+    closed_statuses = DEAL_STATUSES["successful"] | DEAL_STATUSES["failed"]
+
+    ids = np.arange(first_id, first_id + rows)
+    price = pd.Series(rng.integers(1, 2_000_000, rows)).map("{:,}".format)
+    price[rng.random(rows) < 0.1] = ""
+    status = pd.Series(np.array(statuses, dtype=object)[rng.integers(0, len(statuses), rows)])
+    owners = np.array(EMPLOYEES + [EXCHANGE], dtype=object)
+    owner_weights = np.array([0.85 / len(EMPLOYEES)] * len(EMPLOYEES) + [0.15])
+    updated = end - pd.to_timedelta(rng.integers(0, days * 86400, rows), unit="s")
+    created = updated - pd.to_timedelta(rng.integers(0, 30 * 86400, rows), unit="s")
+    updated_text = pd.Series(updated.strftime("%d.%m.%Y %H:%M:%S"))
+
+    return pd.DataFrame({
+        "id": ids,
+        "name": "Заявка #" + pd.Series(ids).astype(str),
+        "price": price,
+        "status_id": status,
+        "responsible_user_id": owners[rng.choice(len(owners), rows, p=owner_weights)],
+        "created_at": created.strftime("%d.%m.%Y %H:%M:%S"),
+        "updated_at": updated_text,
+        "closed_at": updated_text.where(status.isin(closed_statuses), "не закрыта"),
+    }, columns=COLUMNS)
+
+
+def write_export(path, rows, chunk_rows=1_000_000, **kwargs):
+    """Writes a synthetic export CSV in chunks so 10M rows don't need to fit in memory at once."""
+    seed = kwargs.pop("seed", 0)
+    for offset in range(0, rows, chunk_rows):
+        chunk = generate_export(min(chunk_rows, rows - offset), seed=seed + offset, first_id=30_000_000 + offset, **kwargs)
+        chunk.to_csv(path, mode="w" if offset == 0 else "a", header=offset == 0, index=False, encoding="utf-8")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rows", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_export(args.path, args.rows, days=args.days, seed=args.seed)
@@ -0,0 +1,181 @@
+import os
+import time
+import sqlite3
+import logging
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import BATCH_REPORTS_DB, BATCH_WORKERS, OPENAI_RPM, OPENAI_TPM
+from fanout import RateLimiter
+from instrumentation import increment, llm_usage
+from prompt import estimate_tokens
+from report import generate_report, compute_report_metrics, narrative_messages, NARRATIVE_MAX_TOKENS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    date TEXT PRIMARY KEY,
+    report TEXT,
+    error TEXT,
+    tokens INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    finished_at REAL NOT NULL
+);
+"""
+
+
+class BatchResults:
+    """Reports generated by run_batch, one row per date; failed dates keep their error."""
+
+    def __init__(self, path=BATCH_REPORTS_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def done(self):
+        """Dates that already have a report."""
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute("SELECT date FROM reports WHERE report IS NOT NULL")}
+
+    def save(self, date, report, error, tokens, seconds):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (date, report, error, tokens, seconds, finished_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (date, report, error, tokens, seconds, time.time()),
+            )
+
+    def reports(self, start=None, end=None):
+        """{date: report} for finished dates in [start, end]."""
+        with self._connect() as conn:
+            return dict(conn.execute(
+                "SELECT date, report FROM reports WHERE report IS NOT NULL AND date >= ? AND date <= ? ORDER BY date",
+                (start or "", end or "9999-99-99"),
+            ))
+
+
+def data_summary(store, date):
+    """Rebuilds send_report_day's data_summary for a stored date, or None if it is not stored."""
+    entry = store.get(date)
+    if entry is None:
+        return None
+    successful = {}
+    deals = store.deals(columns=["responsible_user_id", "price"], start=date, end=date, kind="successful")
+    for employee, price in zip(deals["responsible_user_id"], deals["price"]):
+        # Сделки "Биржа заявок" хранятся только в деталях, в отчёте её нет (как в send_report_day)
+        if employee == "Биржа заявок":
+            continue
+        values = successful.setdefault(employee, {"price": 0.0, "successful_deals": 0})
+        values["price"] += price or 0.0
+        values["successful_deals"] += 1
+    return {
+        "date": date,
+        "total_revenue": entry.get("total_revenue"),
+        "margin": entry.get("margin"),
+        "total_revenue_per_employee": entry.get("total_revenue_per_employee"),
+        "deal_counts": entry.get("deal_counts"),
+        "employee_activity": entry.get("employee_activity"),
+        "successful_deals": successful,
+    }
+
+
+def estimate_job_tokens(summary):
+    """Prompt tokens (offline estimate) plus the completion limit of one narrative request."""
+    messages = narrative_messages(compute_report_metrics(summary))
+    return sum(estimate_tokens(message["content"]) for message in messages) + NARRATIVE_MAX_TOKENS
+
+
+@dataclass
+class BatchStats:
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+
+    def summary(self):
+        minutes = self.seconds / 60 or 1 / 60
+        return (f"{self.done} reports in {self.seconds:.1f}s ({self.done / minutes:.1f}/min, "
+                f"{self.tokens / minutes:.0f} tokens/min), {self.failed} failed, {self.skipped} already done")
+
+
+def run_batch(dates, store, results=None, workers=BATCH_WORKERS, rpm=OPENAI_RPM, tpm=OPENAI_TPM):
+    """Generates reports with an LLM narrative for many dates concurrently.
+
+    Requests are paced by two shared token buckets (requests and estimated tokens per
+    minute, bursts limited to about one second's share). Each report is saved to `results`
+    as soon as it is ready, so an interrupted run resumes by skipping dates that already have
+    one; failed dates are retried on the next run. On interruption requests already sent are
+    waited for and saved, the rest are cancelled. Returns BatchStats with the throughput and
+    the tokens reported in the responses' usage (the estimate where a response has none).
+    """
+    results = results or BatchResults()
+    finished = results.done()
+    stats = BatchStats(skipped=sum(1 for date in dates if date in finished))
+    jobs = []
+    for date in dates:
+        if date in finished:
+            continue
+        summary = data_summary(store, date)
+        if summary is None:
+            logging.warning(f"Batch: no stored report for {date}, skipped")
+            continue
+        jobs.append((date, summary, estimate_job_tokens(summary)))
+    if not jobs:
+        logging.info(f"Batch: nothing to do ({stats.skipped} already done)")
+        return stats
+
+    # Лимиты OpenAI действуют и на долях минуты, поэтому всплеск ограничен секундной долей лимита
+    requests_limiter = RateLimiter(rpm, per=60, burst=max(1, rpm // 60))
+    tokens_limiter = RateLimiter(tpm, per=60, burst=max(tpm // 60, max(tokens for _, _, tokens in jobs)))
+
+    def run(summary, tokens):
+        requests_limiter.acquire()
+        tokens_limiter.acquire(tokens)
+        start = time.perf_counter()
+        with llm_usage() as usage:
+            report = generate_report(summary, narrative=True, raise_errors=True)
+        used = usage["tokens"] + (usage["calls"] - usage["reported"]) * tokens
+        return report, time.perf_counter() - start, used
+
+    def collect(future):
+        date, tokens = futures[future]
+        try:
+            report, seconds, used = future.result()
+        except Exception as e:
+            logging.error(f"Batch: report for {date} failed: {e}")
+            results.save(date, None, str(e), tokens, 0.0)
+            stats.failed += 1
+            increment("batch.failed")
+            return
+        results.save(date, report, None, used, seconds)
+        stats.done += 1
+        stats.tokens += used
+        increment("batch.done")
+
+    logging.info(f"Batch: generating {len(jobs)} reports with {workers} workers, limits {rpm} RPM / {tpm} TPM")
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    futures = {executor.submit(run, summary, tokens): (date, tokens) for date, summary, tokens in jobs}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures):
+            pending.discard(future)
+            collect(future)
+    finally:
+        # При прерывании ждём только уже запущенные запросы, остальные дни останутся на следующий запуск.
+        # Запущенные уже оплачены, поэтому их результаты сохраняются, чтобы не запрашивать их снова
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in pending:
+            if not future.cancelled():
+                collect(future)
+        if pending:
+            logging.warning(f"Batch: interrupted, {stats.done} reports saved, "
+                            f"{sum(future.cancelled() for future in pending)} left for the next run")
+    stats.seconds = time.perf_counter() - started
+    logging.info(f"Batch: {stats.summary()}")
+    return stats
@@ -1,21 +1,24 @@
 import os
-import openai
 import logging
-import schedule
 import time
-import telebot
 import requests
 import pandas as pd
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from process_csv import Process
-from config import generate_report, convert_to_python_types, TEMP_FILE, FILE_URL, CSV_FILE, DEAL_STATUSES, CUMULATIVE_JSON
-import json
-import numpy as np
-from langchain.chat_models import ChatOpenAI
-from langchain.agents import create_json_agent
-from langchain.agents.agent_toolkits import JsonToolkit
-from langchain.tools.json.tool import JsonSpec
+from storage import get_store
+from ingest import refresh_snapshot
+from config import convert_to_python_types, get_openai_client, TELEGRAM_API_URL, REPORT_RESEND_DAYS, DEAL_STATUSES, SNAPSHOT_FILE, METRICS_FILE, METRICS_PORT, CHAT_WORKERS, CHAT_MAX_PENDING, CHAT_QUEUE_TIMEOUT, CHAT_LLM_TIMEOUT, CHAT_LLM_RETRIES
+from dispatcher import ChatDispatcher
+from instrumentation import span, timed, profiled, write_metrics_file, start_metrics_server
+from concurrent.futures import ThreadPoolExecutor
+from report import generate_report
+from query import answer_question
+from dataset import get_dataset
+from subscribers import get_subscribers
+from fanout import broadcast, chat_unreachable
+from catchup import catch_up
+from deal_history import get_deal_history
 import threading
 
 
@@ -23,51 +26,60 @@ load_dotenv()
 
 # Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('BOT_TOKEN')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 CHAT_ID = "your_chat_id"
 
-# Initialize bot and OpenAI
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
-
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
+# TeleBot создаётся при первом обращении: бэкфилу и запросам из CLI токен не нужен
+_bot = None
+_bot_lock = threading.Lock()
+
+
+def get_bot():
+    """Returns the process-wide TeleBot; telebot is imported on first use.
+
+    Bot API calls go through the shared transport (pooled session, retries, circuit breaker).
+    """
+    global _bot
+    with _bot_lock:
+        if _bot is None:
+            import telebot
+            from telebot import apihelper
+            from transport import telegram_request_sender
+            apihelper.CUSTOM_REQUEST_SENDER = telegram_request_sender
+            if TELEGRAM_API_URL:
+                apihelper.API_URL = TELEGRAM_API_URL
+            _bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
+        return _bot
+
+
+def send_message(chat_id, text):
+    """bot.send_message, timed as the telegram.send_message stage."""
+    with span("telegram.send_message"):
+        return get_bot().send_message(chat_id, text)
+
+
+@timed("download_and_convert_xlsx")
 def download_and_convert_xlsx():
-    """Downloads the Excel file, converts it to CSV, and deletes the temp file."""
+    """Refreshes the local deal snapshot from the export. Returns False if the refresh failed."""
     try:
-        response = requests.get(FILE_URL)
-        response.raise_for_status()
-        
-        with open(TEMP_FILE, "wb") as f:
-            f.write(response.content)
-        
-        df = pd.read_excel(
-            TEMP_FILE,
-            converters={
-                'updated_at': lambda x: pd.to_datetime(x, unit='D', origin='1899-12-30') 
-                if isinstance(x, (int, float)) else x
-            }
-        )
-        df = df.iloc[1:]  # Remove the first row
-        df = df[df['responsible_user_id'] != "Муратова Рината"] 
-        df.to_csv(CSV_FILE, index=False, encoding='utf-8')
-        logging.info("File successfully downloaded and converted to CSV.")
+        refresh_snapshot()
+        logging.info("Deal snapshot is up to date.")
+        return True
     
     except requests.RequestException as e:
         logging.error(f"Error downloading file: {e}")
     
     except Exception as e:
         logging.error(f"Error processing file: {e}")
-    
-    finally:
-        if os.path.exists(TEMP_FILE):
-            os.remove(TEMP_FILE)
-            logging.info(f"Temporary file {TEMP_FILE} deleted.")
+
+    # Callers fall back to the last stored snapshot
+    return False
 
 def get_chat_id():
-    """Gets the chat ID by retrieving updates from Telegram."""
-    updates = bot.get_updates()
+    """Gets the chat ID by retrieving updates from Telegram (fallback when nobody has subscribed)."""
+    updates = get_bot().get_updates()
     if updates and updates[-1].message:
         chat_id = updates[-1].message.chat.id
         logging.info(f"Retrieved Chat ID: {chat_id}")
@@ -78,24 +90,99 @@ def get_chat_id():
 
 
 def send_report_day():
-    """Processes CSV, generates a report, and sends it to Telegram."""
+    """Processes the deal snapshot, generates a report, and sends it to Telegram."""
+    try:
+        with profiled("send_report_day"), span("send_report_day"):
+            _send_report_day()
+    finally:
+        write_metrics_file(METRICS_FILE)
+
+
+def report_recipients():
+    """Subscribed chats; without subscribers, the last chat that wrote to the bot."""
+    chat_ids = get_subscribers().chat_ids()
+    if chat_ids:
+        return chat_ids
+    logging.warning("No subscribers, falling back to the last chat from updates")
     chat_id = get_chat_id()
-    if not chat_id:
-        logging.error("Cannot send report. Chat ID not found.")
+    return [chat_id] if chat_id else []
+
+
+def send_report(text):
+    """Sends the rendered report to all recipients; chats that blocked the bot are unsubscribed.
+
+    Returns the number of chats the report was delivered to.
+    """
+    chat_ids = report_recipients()
+    if not chat_ids:
+        logging.error("Cannot send report. No recipients.")
+        return 0
+    with span("send_report.broadcast", recipients=len(chat_ids)):
+        results = broadcast(send_message, chat_ids, text)
+    for chat_id, error in results.items():
+        if chat_unreachable(error):
+            get_subscribers().remove(chat_id)
+    failed = sum(error is not None for error in results.values())
+    logging.info(f"Report delivered to {len(results) - failed} of {len(results)} chats")
+    return len(results) - failed
+
+
+def report_days(last_completed, yesterday):
+    """Days whose report is due: after the checkpoint up to yesterday, at most REPORT_RESEND_DAYS.
+
+    Without a checkpoint (first run) only yesterday; older undelivered days are caught up silently.
+    """
+    if not last_completed:
+        return [yesterday]
+    first = max(pd.Timestamp(last_completed) + timedelta(days=1), yesterday - timedelta(days=REPORT_RESEND_DAYS - 1))
+    return list(pd.date_range(first, yesterday, freq="D"))
+
+
+def _send_report_day():
+    yesterday = pd.Timestamp(datetime.now() - timedelta(days=1)).normalize()
+    last_completed = get_store().last_completed()
+    if last_completed and last_completed >= yesterday.strftime('%Y-%m-%d'):
+        logging.info(f"Report for {last_completed} was already sent.")
         return
-    
-    download_and_convert_xlsx()
-    
-    df = Process.read_csv_file(CSV_FILE)
-    if df is None:
-        logging.error("Failed to read CSV file. Skipping report generation.")
+
+    # На устаревшем снимке день посчитался бы неполным, а чекпоинт ушёл бы вперёд:
+    # отчёт не строим, следующий запуск (раз в час) попробует снова
+    if not download_and_convert_xlsx():
+        logging.error("Deal snapshot was not refreshed. Skipping report generation.")
         return
-    
-    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-    df['updated_at'] = pd.to_datetime(df['updated_at'])
-    df_day = df[df['updated_at'].dt.strftime('%Y-%m-%d') == yesterday]
+    deals = get_dataset().deals()
+    if deals is None:
+        logging.error("No deal snapshot available. Skipping report generation.")
+        return
+
+    # Состояние сделок на сегодня для истории переходов между статусами
+    try:
+        get_deal_history().record(datetime.now().date(), deals)
+    except Exception as e:
+        logging.error(f"Recording deal history failed: {e}")
+
+    days = report_days(last_completed, yesterday)
+    # Дни до первого отчёта, пропущенные пока бот не работал, догружаются без отправки
+    try:
+        filled = catch_up(deals, get_store(), days[0] - timedelta(days=1))
+        if filled:
+            get_dataset().invalidate()
+        caught_up = True
+    except Exception as e:
+        logging.error(f"Catch-up of missing days failed: {e}")
+        caught_up = False
+
+    # Неотправленные отчёты уходят по порядку: чекпоинт не может перескочить недоставленный день
+    for day in days:
+        if not _report_day(deals, day, caught_up):
+            break
+
+
+def _report_day(deals, day, caught_up):
+    """Computes, sends and saves the report of one day. Returns True if it reached a chat."""
+    df_day = deals[deals['date'] == day]
     df_day = df_day[df_day['responsible_user_id'] != "Муратова Рината"]
-    logging.info("Processing CSV file...")
+    logging.info(f"Processing deal snapshot for {day:%Y-%m-%d}...")
     df_day = df_day[df_day['responsible_user_id'] != "Биржа заявок"]
     total_revenue, margin = Process.calculate_total_revenue(df_day)
     total_revenue_per_employee = Process.calculate_revenue_per_employee(df_day)
@@ -103,10 +190,12 @@ def send_report_day():
     
     employee_activity = Process.calculate_employee_activity(df_day)
     
-    successful_deals = df_day[df_day['status_id'].isin(DEAL_STATUSES['successful'])].groupby("responsible_user_id").agg({"price": "sum", "status_id": "count"}).rename(columns={"status_id": "successful_deals"})
+    successful_deals = df_day[df_day['status_id'].isin(DEAL_STATUSES['successful'])].groupby("responsible_user_id", observed=True).agg({"price": "sum", "status_id": "count"}).rename(columns={"status_id": "successful_deals"}).to_dict(orient="index")
     
     logging.info("Generating report...")
+    date = day.strftime('%Y-%m-%d')
     data_summary = {
+        "date": date,
         "total_revenue": total_revenue,
         "margin": margin,
         "total_revenue_per_employee": total_revenue_per_employee,
@@ -117,92 +206,88 @@ def send_report_day():
     report = generate_report(data_summary)
     
     logging.info("Sending report to Telegram...")
-    bot.send_message(chat_id, f"Ежедневный отчёт:\n{report}")
-    save_cumulative_json(df_day, yesterday, total_revenue, margin, total_revenue_per_employee, deal_counts, employee_activity)  # Updated function call
+    delivered = send_report(f"Ежедневный отчёт:\n{report}")
+    if not delivered:
+        logging.error(f"Report for {date} was not delivered to any chat; the hourly run will send it again.")
+    # День сохраняется в любом случае, а чекпоинт двигается только после догрузки и доставки
+    save_cumulative_json(df_day, date, total_revenue, margin, total_revenue_per_employee, deal_counts, employee_activity,
+                         completed=date if caught_up and delivered else None)
+    return bool(delivered)
+
 
+def save_cumulative_json(df_day, date, total_revenue, margin, total_revenue_per_employee, deal_counts, employee_activity,
+                         completed=None):
+    """Saves the daily report into the cumulative report store; `completed` advances the checkpoint."""
+    deals = {
+        "successful": Process.get_deals_records(df_day, DEAL_STATUSES['successful']),
+        "failed": Process.get_deals_records(df_day, DEAL_STATUSES['failed']),
+    }
+    new_entry = build_cumulative_entry(date, total_revenue, margin, total_revenue_per_employee, deal_counts,
+                                       employee_activity, deals)
+    save_cumulative_entries([new_entry], completed)
 
-def save_cumulative_json(df_day, date, total_revenue, margin, total_revenue_per_employee, deal_counts, employee_activity):
-    """Saves cumulative daily reports into a JSON file with Cyrillic support."""
-    successful_details = Process.get_deals_details(df_day, DEAL_STATUSES['successful'], "successful_deals")
-    failed_details = Process.get_deals_details(df_day, DEAL_STATUSES['failed'], "failed_deals")
 
-    # Convert all data to native Python types
-    new_entry = {
+def build_cumulative_entry(date, total_revenue, margin, total_revenue_per_employee, deal_counts, employee_activity, deals):
+    """Builds one cumulative JSON entry, converting all data to native Python types."""
+    return {
         'updated_at': date,
         'total_revenue': convert_to_python_types(total_revenue),
         'margin': convert_to_python_types(margin),
         'total_revenue_per_employee': convert_to_python_types(total_revenue_per_employee),
         'deal_counts': convert_to_python_types(deal_counts),
         'employee_activity': convert_to_python_types(employee_activity),
-        **convert_to_python_types(successful_details),
-        **convert_to_python_types(failed_details)
+        'deals': deals
     }
 
-    # Read existing data or initialize empty list
-    existing_data = []
-    if os.path.exists(CUMULATIVE_JSON):
-        try:
-            # Check if file is not empty
-            if os.path.getsize(CUMULATIVE_JSON) > 0:
-                with open(CUMULATIVE_JSON, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                # Ensure existing_data is a list
-                if not isinstance(existing_data, list):
-                    logging.warning("Corrupted JSON structure. Reinitializing.")
-                    existing_data = []
-            else:
-                logging.info("JSON file is empty. Starting fresh.")
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON decode error: {e}. Reinitializing file.")
-            existing_data = []
-
-    # Append new entry
-    existing_data.append(new_entry)
-
-    # Write back with UTF-8 and proper formatting
-    with open(CUMULATIVE_JSON, 'w', encoding='utf-8') as f:
-        json.dump(existing_data, f, indent=4, ensure_ascii=False)
-
-    logging.info(f"Updated cumulative JSON for {date}")
-
-
-def generate_historical_data():
+
+def save_cumulative_entries(entries, completed=None):
+    """Upserts a batch of entries into the cumulative report store by date."""
+    get_store().upsert(entries, completed)
+    get_dataset().invalidate()
+
+
+def generate_historical_data(streaming=False):
+    """Recomputes every day of the snapshot; streaming=True reads it in chunks with bounded memory."""
     try:
         download_and_convert_xlsx()
-        df = Process.read_csv_file(CSV_FILE)
-        if df is None:
-            logging.error("Failed to read CSV file in historical data.")
-            return
-        
-        # Process dates
-        df['updated_at'] = pd.to_datetime(df['updated_at'], errors='coerce')
-        df = df.dropna(subset=['updated_at'])
-        df['date'] = df['updated_at'].dt.strftime('%Y-%m-%d')  # Now a string column
-        
-        # Filter out excluded users
-        df = df[df['responsible_user_id'] != "Муратова Рината"]
-        
-        # Process each unique date string
-        for date_str in df['date'].unique():  # date_str is already a string
-            df_date = df[df['date'] == date_str]
-            
-            # Calculate metrics
-            df_date_filtered = df_date[df_date['responsible_user_id'] != "Биржа заявок"]
-            deal_counts = Process.count_deal_stages(df_date_filtered)
-            total_revenue, margin = Process.calculate_total_revenue(df_date_filtered)
-            total_revenue_per_employee = Process.calculate_revenue_per_employee(df_date_filtered)
-            employee_activity = Process.calculate_employee_activity(df_date_filtered)
-            
-            # Save using the date string directly
-            save_cumulative_json(
-                df_date, 
-                date_str,  # Pass the string, no need for .strftime()
-                total_revenue, 
-                margin, 
-                total_revenue_per_employee, 
-                deal_counts, 
-                employee_activity
+        if streaming:
+            if not os.path.exists(SNAPSHOT_FILE):
+                logging.error("No deal snapshot available for historical data.")
+                return
+            # Сделки сразу пишутся в хранилище по дням каждого чанка, в памяти копятся только суммы
+            written = set()
+
+            def write_deals(date, kinds):
+                day = date.strftime('%Y-%m-%d')
+                get_store().add_deals({day: kinds}, replace=() if day in written else (day,))
+                written.add(day)
+
+            daily_metrics = Process.stream_daily_metrics(SNAPSHOT_FILE, exclude_users=("Муратова Рината",),
+                                                         keep_deals=False, on_deals=write_deals)
+        else:
+            deals = get_dataset().deals()
+            if deals is None:
+                logging.error("No deal snapshot available for historical data.")
+                return
+
+            # Drop deals without a date and excluded users
+            deals = deals[deals['date'].notna() & (deals['responsible_user_id'] != "Муратова Рината")]
+
+            # All dates in one groupby pass, then a single write
+            daily_metrics = Process.calculate_daily_metrics(deals)
+        entries = [
+            build_cumulative_entry(
+                metrics['updated_at'],
+                metrics['total_revenue'],
+                metrics['margin'],
+                metrics['total_revenue_per_employee'],
+                metrics['deal_counts'],
+                metrics['employee_activity'],
+                metrics.get('deals')
             )
+            for metrics in daily_metrics
+        ]
+        save_cumulative_entries(entries)
         
         logging.info("Historical data processing completed")
     
@@ -210,136 +295,91 @@ def generate_historical_data():
         logging.error(f"Error processing historical data: {e}")
 
 
-@bot.message_handler(func=lambda message: True)
+def chat_openai_client():
+    """The OpenAI client with the chat deadline: CHAT_LLM_TIMEOUT per attempt, CHAT_LLM_RETRIES retries."""
+    return get_openai_client().with_options(timeout=CHAT_LLM_TIMEOUT, max_retries=CHAT_LLM_RETRIES)
+
+
 def handle_message(message):
-    """Handles user questions, retrieves raw data, and processes with OpenAI."""
+    """Handles user questions with query.answer_question: common ones locally, the rest with one OpenAI call."""
     try:
         user_question = message.text
         chat_id = message.chat.id
         
-        bot.send_message(chat_id, "Обрабатываю ваш запрос...")
-        agent = setup_json_agent()
-        
-        if not agent:
-            bot.send_message(chat_id, "Данные временно недоступны. Попробуйте позже.")
+        history = get_dataset().history()
+        if not history.entries:
+            send_message(chat_id, "Данные временно недоступны. Попробуйте позже.")
             return
 
-        # Step 1: Get raw data using modified question
-        retrieval_prompt = f"""
-        В JSON-файле содержатся данные за последние 3 месяца.  
-            Дата указана в ключе `updated_at` в формате `yyyy-mm-dd`.  
-            Для определения и расчёета периода используйте этот ключ.
-            В deal_counts содержится информация по всем сделкам за день: Успешным сделкам, Проваленным сделкам и Сделкам в работе.
+        with span("handle_message"):
+            answer = answer_question(user_question, history, chat_openai_client(),
+                                     before_llm=lambda: send_message(chat_id, "Обрабатываю ваш запрос..."))
+        send_message(chat_id, answer)
 
-            - Извлеките **только сырые данные**, без выполнения каких-либо вычислений.  
-            - Значения прибыли за указанный день находятся в ключе `total_revenue`.  
-            - Если в запросе указан конкретный период, извлеки данные по соответствующим дням и месяцам, учитывая формат `yyyy-mm-dd`.
-            Если запрашивается период за последние 10 дней, то нужно считать начиная со вчерашнего дня в формате yyyy-mm-dd, и не раньше вем (yyyy-mm-dd - 10 дней)
-            Если есть данные только за меньшее количество дней чем запрашиваемый период, то вытащи за все дни информацию не меньше и не больше запрашиваемого периода.
-            Если вчера было 2025-03-01, то нужно отнять от первого марта 2025-го года 10 дней и вытащить информацию только за период с 19-го февраля.
+    except Exception as e:
+        logging.error(f"Error handling message: {e}")
+        send_message(chat_id, "Произошла ошибка. Пожалуйста, попробуйте еще раз.")
 
-            Верните **только фактические значения** из данных в исходном виде.  
-            **Вопрос:** {user_question}
 
-        """
-        
-        try:
-            raw_data = agent.run(retrieval_prompt)
-        except Exception as e:
-            logging.error(f"Data retrieval failed: {e}")
-            bot.send_message(chat_id, "Ошибка при получении данных.")
-            return
+# The daily report runs on its own thread so chat traffic never delays it
+report_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
 
-        # Step 2: Process data with OpenAI
-        analysis_prompt = f"""
-        Проанализируй данные и ответь на вопрос на русском языке. 
-        Всегда прибыль считай в тенге.
-        Обязательно выполни все необходимые расчеты. 
-        Если в данных есть временные метки, учитывай их при анализе.
-        
-        Вопрос: {user_question}
-        Данные: {raw_data}
-        
-        Формат ответа:
-        - Краткий вывод в начале
-        - Подробное объяснение с расчетами
-        - Основные выводы в конце
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "Ты финансовый аналитик. Отвечай на русском."},
-                {"role": "user", "content": analysis_prompt}
-            ],
-            temperature=0.1
-        )
-        
-        final_answer = response.choices[0].message.content.strip()
-        bot.send_message(chat_id, final_answer)
 
-    except Exception as e:
-        logging.error(f"Error handling message: {e}")
-        bot.send_message(chat_id, "Произошла ошибка. Пожалуйста, попробуйте еще раз.")
+def register_handlers(bot, dispatcher):
+    """Registers the /subscribe, /unsubscribe and question handlers on `bot`."""
 
-def setup_json_agent():
-    """Improved JSON agent initialization with data validation"""
-    try:
-        if not os.path.exists(CUMULATIVE_JSON):
-            raise FileNotFoundError("Cumulative JSON file missing")
-            
-        with open(CUMULATIVE_JSON, "r", encoding='utf-8') as f:
-            data = json.load(f)
-            
-        # Transform data structure
-        processed_data = {}
-        for entry in data:
-            for key, value in entry.items():
-                if key not in processed_data:
-                    processed_data[key] = []
-                processed_data[key].append(value)
-                
-        # Enhanced data validation
-        required_keys = ['total_revenue', 'updated_at', 'margin', 'successful_deals_price', 'total_revenue_per_employee', 'deal_counts', 'employee_activity']
-        for key in required_keys:
-            if key not in processed_data:
-                raise ValueError(f"Missing required key in data: {key}")
-
-        spec = JsonSpec(dict_=processed_data, max_value_length=10000)
-        toolkit = JsonToolkit(spec=spec)
-        
-        return create_json_agent(
-            llm=ChatOpenAI(
-                temperature=0,
-                model="gpt-4-1106-preview",  # Use latest model
-                openai_api_key=OPENAI_API_KEY,
-                max_tokens=1000
-            ),
-            toolkit=toolkit,
-            max_iterations=500,
-            handle_parsing_errors=True
-        )
-        
-    except Exception as e:
-        logging.error(f"Agent setup failed: {str(e)}")
-        return None
+    @bot.message_handler(commands=["subscribe"])
+    def on_subscribe(message):
+        """Adds the chat to the daily report recipients."""
+        chat = message.chat
+        added = get_subscribers().add(chat.id, chat.title or chat.username)
+        send_message(chat.id, "Чат подписан на ежедневный отчёт." if added else "Чат уже подписан на ежедневный отчёт.")
 
+    @bot.message_handler(commands=["unsubscribe"])
+    def on_unsubscribe(message):
+        """Removes the chat from the daily report recipients."""
+        removed = get_subscribers().remove(message.chat.id)
+        send_message(message.chat.id, "Подписка на ежедневный отчёт отменена." if removed else "Чат не был подписан.")
 
-def start_bot():
-    """Starts the Telegram bot in polling mode."""
-    bot.infinity_polling()
+    @bot.message_handler(func=lambda message: True)
+    def on_message(message):
+        """Queues incoming messages; handle_message runs on the dispatcher's worker pool."""
+        dispatcher.submit(message)
 
-if __name__ == "__main__":
-    #generate_historical_data()
-    send_report_day()
-    schedule.every().day.at("01:00").do(send_report_day)
+
+def submit_report_day():
+    """Schedules send_report_day on the report executor."""
+    future = report_executor.submit(send_report_day)
+    future.add_done_callback(lambda f: f.exception() and logging.error(f"Daily report failed: {f.exception()}"))
+
+
+def serve():
+    """Runs the bot: report job every hour (and once on start), chat polling, optional /metrics.
+
+    The job does nothing once yesterday's report is delivered, so the hourly runs only retry
+    after a failed refresh or delivery; the first one after midnight sends the new report.
+    """
+    import schedule
+    bot = get_bot()
+    dispatcher = ChatDispatcher(bot, handle_message, CHAT_WORKERS, CHAT_MAX_PENDING, CHAT_QUEUE_TIMEOUT)
+    register_handlers(bot, dispatcher)
+
+    submit_report_day()
+    schedule.every().hour.at(":00").do(submit_report_day)
     
     # Start bot in a separate thread
-    bot_thread = threading.Thread(target=start_bot)
+    bot_thread = threading.Thread(target=bot.infinity_polling)
     bot_thread.daemon = True
     bot_thread.start()
     
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    
     logging.info("Bot started. Listening for messages and running scheduled tasks...")
     while True:
         schedule.run_pending()
         time.sleep(60)
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,61 @@
+import logging
+import pandas as pd
+from datetime import date, timedelta
+from config import CATCHUP_BATCH_DAYS
+from instrumentation import timed
+from ingest import EXCLUDED_USERS
+from process_csv import group_daily_metrics, build_daily_entries, daily_deals_records
+
+
+def missing_dates(store, until, first=None):
+    """Days after the last checkpoint up to `until` (inclusive) that are not stored yet.
+
+    Without a checkpoint the search starts after the latest stored day, or at `first`
+    for an empty history. Dates are datetime.date objects in ascending order.
+    """
+    until = pd.Timestamp(until).date()
+    stored = store.dates()
+    start = store.last_completed() or (stored[-1] if stored else None)
+    if start is not None:
+        start = date.fromisoformat(start) + timedelta(days=1)
+    elif first is not None:
+        start = pd.Timestamp(first).date()
+    else:
+        return []
+    stored = set(stored)
+    return [
+        day for day in (start + timedelta(days=offset) for offset in range((until - start).days + 1))
+        if day.isoformat() not in stored
+    ]
+
+
+@timed("catch_up")
+def catch_up(deals, store, until, batch_days=CATCHUP_BATCH_DAYS):
+    """Computes the days missing from the history up to `until` and saves them.
+
+    `deals` is a Process.load_deal_frame frame of the snapshot. All missing days are
+    computed in one groupby pass and saved `batch_days` at a time, each batch together
+    with its checkpoint, so after a crash the next run continues from the last saved
+    batch. Days without deals are saved as zero entries, as the daily report does.
+    Returns the list of saved 'YYYY-MM-DD' dates.
+    """
+    first = deals["date"].min() if len(deals) else None
+    days = missing_dates(store, until, None if pd.isna(first) else first)
+    if not days:
+        store.mark_completed(pd.Timestamp(until).date().isoformat())
+        return []
+
+    logging.info(f"Catching up {len(days)} missing days: {days[0]}..{days[-1]}")
+    timestamps = [pd.Timestamp(day) for day in days]
+    # Те же исключения, что и в ежедневном отчёте
+    excluded = EXCLUDED_USERS | {"Биржа заявок"}
+    frame = deals[deals["date"].isin(timestamps) & ~deals["responsible_user_id"].isin(excluded)]
+    entries = build_daily_entries(group_daily_metrics(frame), timestamps, daily_deals_records(frame))
+
+    last = pd.Timestamp(until).date().isoformat()
+    for i in range(0, len(entries), batch_days):
+        batch = entries[i:i + batch_days]
+        # Последняя порция закрывает весь период, включая уже сохранённые дни после неё
+        completed = last if i + batch_days >= len(entries) else batch[-1]["updated_at"]
+        store.upsert(batch, completed=completed)
+    return [entry["updated_at"] for entry in entries]
@@ -0,0 +1,94 @@
+"""Command line entry point.
+
+    python src/cli.py report                 # build and send yesterday's report
+    python src/cli.py backfill [--streaming] # recompute every day of the snapshot
+    python src/cli.py serve                  # run the bot (same as python src/bot.py)
+    python src/cli.py query "выручка за вчера" [--no-llm]
+    python src/cli.py narratives --start 2025-01-01 --end 2025-03-31 [--workers 8 --rpm 500 --tpm 10000]
+    python src/cli.py --profile profiles backfill   # any subcommand under cProfile
+
+Modules are imported inside each subcommand, so `query` answered locally never loads
+pandas, openai or telebot, and `backfill` needs no Telegram or OpenAI credentials.
+"""
+import sys
+import logging
+import argparse
+
+
+def run_report(args):
+    from bot import send_report_day
+    send_report_day()
+
+
+def run_backfill(args):
+    from bot import generate_historical_data
+    generate_historical_data(streaming=args.streaming)
+
+
+def run_serve(args):
+    from bot import serve
+    serve()
+
+
+def run_query(args):
+    from dataset import get_dataset
+    from query import answer_question
+    history = get_dataset().history()
+    if not history.entries:
+        print("Нет сохранённых отчётов.")
+        return 1
+    answer = answer_question(args.question, history)
+    if answer is None:
+        if args.no_llm:
+            print("Вопрос не распознан, а обращение к LLM отключено (--no-llm).")
+            return 1
+        from config import get_openai_client
+        from query import ask_llm
+        answer = ask_llm(get_openai_client(), args.question, history)
+    print(answer)
+    return 0
+
+
+def run_narratives(args):
+    from batch import run_batch
+    from storage import get_store
+    store = get_store()
+    dates = [date for date in store.dates() if (args.start or "") <= date <= (args.end or "9999-99-99")]
+    stats = run_batch(dates, store, workers=args.workers, rpm=args.rpm, tpm=args.tpm)
+    print(stats.summary())
+    return 1 if stats.failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отчёты отдела продаж по выгрузке amoCRM.")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="profile the run with cProfile, save <DIR>/<command>-<time>.prof and log the top functions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("report", help="send yesterday's report to the subscribers").set_defaults(run=run_report)
+    backfill = commands.add_parser("backfill", help="recompute the history from the deal snapshot")
+    backfill.add_argument("--streaming", action="store_true", help="read the snapshot in chunks (bounded memory)")
+    backfill.set_defaults(run=run_backfill)
+    commands.add_parser("serve", help="run the Telegram bot and the daily schedule").set_defaults(run=run_serve)
+    query = commands.add_parser("query", help="answer a question about the stored history")
+    query.add_argument("question")
+    query.add_argument("--no-llm", action="store_true", help="answer only locally recognized questions")
+    query.set_defaults(run=run_query)
+
+    from config import BATCH_WORKERS, OPENAI_RPM, OPENAI_TPM
+    narratives = commands.add_parser("narratives", help="generate reports with LLM narratives for stored days")
+    narratives.add_argument("--start", help="first date, YYYY-MM-DD")
+    narratives.add_argument("--end", help="last date, YYYY-MM-DD")
+    narratives.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    narratives.add_argument("--rpm", type=int, default=OPENAI_RPM, help="requests per minute")
+    narratives.add_argument("--tpm", type=int, default=OPENAI_TPM, help="tokens per minute")
+    narratives.set_defaults(run=run_narratives)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    from instrumentation import profiled
+    with profiled(args.command, args.profile):
+        return args.run(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
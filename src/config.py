@@ -1,23 +1,79 @@
 # config.py
 from datetime import datetime
-import numpy as np
-import pandas as pd
-import openai
 from dotenv import load_dotenv
+import threading
 import os 
 
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Таймаут запросов к OpenAI (секунды), чтобы зависший запрос не держал обработчик
+OPENAI_TIMEOUT = 60
+
+# Общий HTTP-транспорт (выгрузка, OpenAI, Telegram): таймаут, размер пула соединений, повторы
+# с экспоненциальной задержкой (секунды) и автомат, отключающий сервис после серии сбоев
+HTTP_TIMEOUT = 30
+HTTP_POOL_SIZE = 10
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+HTTP_MAX_BACKOFF = 30
+BREAKER_FAILURES = 5
+BREAKER_RESET = 60
+# Адрес Bot API (шаблон вида http://localhost:8081/bot{0}/{1}), например локальный сервер для проверки;
+# OpenAI читает OPENAI_BASE_URL сам
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Пакетная генерация выводов LLM за период: число потоков и лимиты OpenAI (запросов и токенов в минуту)
+BATCH_REPORTS_DB = "data/batch_reports.db"
+BATCH_WORKERS = 8
+OPENAI_RPM = int(os.getenv('OPENAI_RPM', '500'))
+OPENAI_TPM = int(os.getenv('OPENAI_TPM', '10000'))
+
+# Метрики в формате Prometheus: файл обновляется после каждого отчёта, порт — по желанию
+METRICS_FILE = "data/metrics.prom"
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# Обработка сообщений: число потоков, размер очереди и сколько сообщение может ждать в очереди (секунды)
+CHAT_WORKERS = 4
+CHAT_MAX_PENDING = 100
+CHAT_QUEUE_TIMEOUT = 120
+# Запрос к OpenAI из чата: таймаут одной попытки (секунды) и число повторов,
+# чтобы зависший вызов не занимал поток обработки дольше ~CHAT_LLM_TIMEOUT * (CHAT_LLM_RETRIES + 1)
+CHAT_LLM_TIMEOUT = 30
+CHAT_LLM_RETRIES = 1
+
+# Догрузка пропущенных дней: сколько дней сохраняется за одну транзакцию (контрольную точку)
+CATCHUP_BATCH_DAYS = 7
+# Сколько последних неотправленных дней получают свой отчёт при повторе; более ранние догружаются молча
+REPORT_RESEND_DAYS = 3
+
+# Подписчики ежедневного отчёта (/subscribe) и лимиты рассылки: сообщений в секунду на весь бот,
+# число потоков и повторов при ошибке 429
+SUBSCRIBERS_DB = "data/subscribers.db"
+BROADCAST_RATE = 25
+BROADCAST_WORKERS = 8
+BROADCAST_RETRIES = 5
 # Путь к файлам
 CSV_FILE_PATH = "data/amocrm18fev.csv"
 TEMP_FILE = "temp.xlsx"
-FILE_URL = "https://amo.promoweb.kz/amo.xlsx"
+FILE_URL = os.getenv('EXPORT_URL', "https://amo.promoweb.kz/amo.xlsx")
 CSV_FILE = "data/amocrm18fev.csv"
+# Снимок выгрузки amoCRM (по id сделки) и заголовки последней загрузки (ETag/Last-Modified)
+SNAPSHOT_FILE = "data/amocrm_snapshot.parquet"
+SNAPSHOT_META = "data/amocrm_snapshot.meta.json"
+
+# Ежедневные снимки сделок в виде изменений (дельт) и полный снимок каждые N дней для быстрого восстановления
+DEAL_HISTORY_DIR = "data/deal_history"
+DEAL_HISTORY_KEYFRAME_DAYS = 30
 
 # config.py
 CUMULATIVE_JSON = "data/cumulative_report.json"
+CUMULATIVE_DB = "data/cumulative_report.db"
+
+# Кэш ответов LLM: время жизни (секунды) и максимальное число записей
+LLM_CACHE_DB = "data/llm_cache.db"
+LLM_CACHE_TTL = 7 * 24 * 3600
+LLM_CACHE_MAX_ENTRIES = 1000
 
 
 # Статусы сделок
@@ -27,12 +83,55 @@ DEAL_STATUSES = {
     "in_progress": {"В РАБОТЕ | БРОНЬ", "ВЫСТАВИЛ СЧЕТ", "РАССЫЛКА", "БЛИЖЕ К СЕЗОНУ", "СДЕЛАЛИ ВТОРОЙ КОНТАКТ", "B2B + Гос закуп", "Квалификация +Прайс", "Лиды просроченные", "БИРЖА ЗАЯВОК"}
 }
 
+# Подписи в записях отчёта: число сделок по категориям статусов (deal_counts)
+# и активность сотрудника (employee_activity)
+DEAL_STAGE_LABELS = {
+    "successful": "Успешные сделки",
+    "failed": "Проваленные сделки",
+    "in_progress": "Сделки в работе",
+}
+TAKEN_KEY = "Количество сделок, взятые в работу сотрудником"
+CLOSED_FAILED_KEY = "Закрытая и Нереализованная сделка"
+
 # Маржинальность
 MARGIN_PERCENTAGE = 0.2
 
+# Бюджет токенов на данные в промпте вопроса к LLM и сколько последних дней всегда остаются подневными
+PROMPT_TOKEN_BUDGET = 3000
+PROMPT_RECENT_DAYS = 7
+
+# Добавлять ли к ежедневному отчёту краткий вывод от LLM (цифры всегда считаются локально)
+REPORT_NARRATIVE = os.getenv('REPORT_NARRATIVE', '0') == '1'
+
+
+_openai_client = None
+_openai_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Returns the process-wide OpenAI client; openai is imported on first use.
+
+    Requests go through transport.openai_http_client (shared pool, circuit breaker); the SDK
+    itself retries with jittered backoff.
+    """
+    global _openai_client
+    with _openai_lock:
+        if _openai_client is None:
+            import openai
+            from transport import openai_http_client
+            _openai_client = openai.OpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT, max_retries=HTTP_RETRIES,
+                                           http_client=openai_http_client())
+        return _openai_client
+
+
+def calculate_margin(total):
+    return total * MARGIN_PERCENTAGE
+
 
 def convert_to_python_types(obj):
     """Converts numpy/pandas types to native Python types for JSON serialization."""
+    import numpy as np
+    import pandas as pd
     if isinstance(obj, (pd.Timestamp, datetime)):
         return obj.strftime('%Y-%m-%d')
     elif isinstance(obj, (np.integer, np.int64)):
@@ -57,27 +156,3 @@ def format_russian_date(date_str):
     }
     date_obj = datetime.strptime(date_str, "%Y-%m-%d")
     return f"{date_obj.day} {months[date_obj.month]} {date_obj.year} года"
-
-
-def generate_report(data_summary):
-    """Generates a report using OpenAI API."""
-    prompt = f"""Analyze the following data summary and provide insights with the following structure: 
-    1. Общая выручка за вчерашний день, сумма продаж (оборот), пример: Общий оборот отдела продаж за вчерашний день: 1 000 000 тенге или (10 продаж)
-    2. Маржинальность 20%, напрмиер: Оборот за прошлый день: 1 000 000 тенге, прибыль 200 000 (20%)
-    3. Количество успешных/проваленных сделок (здесь значения количественные, например 10 сделок успешных, 20 проваленных (закрыто нереализовано))
-    4. Лучший и худший сотрудник считается только по количеству успешных сделок: {data_summary['successful_deals']}, при равном количестве учитывать сумму сделок. 
-    Если и сумма, и количество у всех сотрудников равны, то нет худшего сутрудника, и нужно указать что они показали одинаковые результаты. 
-    Наихудший сотрдник тот, кто показал наименьшее количество успешных сделок c продажами.
-    Один и тот же сотрудник не может быть и лучшим и худшим сотрудником. Всегда указывай сумму сделок вместе с количеством.
-    5. Сводная активность сотрудников (количество изменений в сделках). Например, Сколько взял новых сделок и сколько закрыл сделок
-    6. Анализ эффективности по каждому сотруднику всегда зависит от количества успешных сделок каждого сотрудника: и считается по следующей формуле: (количество успешных сделок сотрудника)/(количество всех взятых сделок для сотрудника)*100)
-Все данные бери отсюда:
-    {data_summary}"""
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are a marketing specialist assistant. Calculate the best and worst employee based on their generated revenue. Answer always in Russian."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content.strip()
@@ -0,0 +1,117 @@
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from config import SNAPSHOT_FILE
+from query import History
+from storage import get_store
+
+# mtime меняется с шагом системного тика, и две записи подряд могут дать ту же подпись файла.
+# Подпись свежих файлов поэтому не запоминается: история перепроверяется по версии хранилища
+RACY_SECONDS = 2.0
+
+
+@dataclass(frozen=True)
+class _Cached:
+    value: object
+    signature: tuple
+
+
+def file_signature(*paths):
+    """(mtime_ns, size, inode) of every path; changes whenever any of the files is rewritten."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def settled(signature):
+    """True if every file of the signature was last modified more than RACY_SECONDS ago."""
+    now = time.time_ns()
+    return all(item is None or now - item[0] >= RACY_SECONDS * 1e9 for item in signature)
+
+
+class Dataset:
+    """Process-wide cache of the report history and the typed deal snapshot.
+
+    Each value is rebuilt when its files change on disk or after invalidate(); the history
+    is reloaded only if the store version moved as well, and is checked against the version
+    on every read while its files are fresher than RACY_SECONDS. The new value is built
+    first and then swapped in with one assignment, so concurrent readers see either the
+    old or the new data, never a partial state.
+    """
+
+    def __init__(self, store=None, snapshot_path=SNAPSHOT_FILE):
+        self.store = store or get_store()
+        self.snapshot_path = snapshot_path
+        self._history = None
+        self._deals = None
+        self._lock = threading.Lock()
+
+    def _history_signature(self):
+        return file_signature(self.store.path, f"{self.store.path}-wal")
+
+    def history(self):
+        """Returns the cumulative report history as a query.History."""
+        cached = self._history
+        signature = self._history_signature()
+        if cached is not None and cached.signature == signature:
+            return cached.value
+        with self._lock:
+            cached = self._history
+            if cached is None or cached.signature != signature:
+                # Версия читается до записей: при гонке ответы LLM окажутся привязаны к более старой версии
+                version = self.store.version()
+                if cached is not None and cached.value.version == version:
+                    # Файлы меняет и checkpoint WAL при закрытии подключения, данные те же
+                    cached = _Cached(cached.value, signature)
+                else:
+                    cached = _Cached(History(self.store.entries(), version, self.store.deals, self.store), signature)
+                    logging.info(f"Loaded report history: {len(cached.value.entries)} days")
+                if not settled(signature):
+                    cached = _Cached(cached.value, None)
+                self._history = cached
+        return cached.value
+
+    def deals(self):
+        """Returns the latest deal snapshot as a Process.load_deal_frame frame, or None."""
+        cached = self._deals
+        signature = file_signature(self.snapshot_path)
+        if cached is not None and cached.signature == signature:
+            return cached.value
+        with self._lock:
+            cached = self._deals
+            if cached is None or cached.signature != signature:
+                # pandas нужен только снимку сделок, история читается без него
+                from ingest import load_snapshot
+                from process_csv import Process
+                snapshot = load_snapshot(self.snapshot_path)
+                deals = Process.load_deal_frame(snapshot) if snapshot is not None else None
+                cached = _Cached(deals, signature)
+                self._deals = cached
+                logging.info(f"Loaded deal snapshot: {0 if deals is None else len(deals)} deals")
+        return cached.value
+
+    def invalidate(self):
+        """Drops cached values so the next read reloads them."""
+        with self._lock:
+            self._history = None
+            self._deals = None
+
+
+_dataset = None
+_dataset_lock = threading.Lock()
+
+
+def get_dataset():
+    """Returns the process-wide Dataset."""
+    global _dataset
+    with _dataset_lock:
+        if _dataset is None:
+            _dataset = Dataset()
+        return _dataset
@@ -0,0 +1,273 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from datetime import date
+from config import DEAL_HISTORY_DIR, DEAL_HISTORY_KEYFRAME_DAYS
+
+# Код -1: сделки нет (ещё не появилась или удалена из выгрузки) либо нет ответственного
+ABSENT = -1
+
+STATE_DTYPE = np.dtype([("id", "<i8"), ("status", "<i4"), ("owner", "<i4"), ("price", "<f8")])
+DELTA_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("status", "<i4"), ("prev_status", "<i4"),
+    ("owner", "<i4"), ("prev_owner", "<i4"),
+    ("price", "<f8"), ("prev_price", "<f8"),
+])
+
+
+def _save_atomic(path, array):
+    partial = f"{path}.part"
+    with open(partial, "wb") as f:
+        np.save(f, array)
+    os.replace(partial, path)
+
+
+def apply_delta(state, delta):
+    """Returns the state (sorted by id) after applying one day's delta."""
+    kept = state[~np.isin(state["id"], delta["id"])]
+    present = delta[delta["status"] != ABSENT]
+    added = np.empty(len(present), dtype=STATE_DTYPE)
+    for field in STATE_DTYPE.names:
+        added[field] = present[field]
+    merged = np.concatenate([kept, added])
+    return merged[np.argsort(merged["id"], kind="stable")]
+
+
+def diff_states(old, new):
+    """Delta between two states sorted by id: new, removed and changed (status, owner or price) deals."""
+    ids = np.union1d(old["id"], new["id"])
+    delta = np.empty(len(ids), dtype=DELTA_DTYPE)
+    delta["id"] = ids
+    for prefix, source in (("prev_", old), ("", new)):
+        position = np.searchsorted(source["id"], ids)
+        found = position < len(source)
+        found[found] = source["id"][position[found]] == ids[found]
+        delta[prefix + "status"] = ABSENT
+        delta[prefix + "owner"] = ABSENT
+        delta[prefix + "price"] = np.nan
+        for field in ("status", "owner", "price"):
+            delta[prefix + field][found] = source[field][position[found]]
+    # У удалённой сделки меняется только статус, владелец и цена остаются прежними
+    removed = delta["status"] == ABSENT
+    delta["owner"][removed] = delta["prev_owner"][removed]
+    delta["price"][removed] = delta["prev_price"][removed]
+    same_price = (delta["price"] == delta["prev_price"]) | (np.isnan(delta["price"]) & np.isnan(delta["prev_price"]))
+    changed = (delta["status"] != delta["prev_status"]) | (delta["owner"] != delta["prev_owner"]) | ~same_price
+    return delta[changed]
+
+
+class DealHistory:
+    """Daily states of the deal table, stored as deltas against the previous recorded day.
+
+    Layout of `directory`: deltas/YYYY-MM-DD.npy (only deals whose status, owner or price
+    changed, plus new and removed ones), keyframes/YYYY-MM-DD.npy (full state every
+    `keyframe_days` days), state.npy (the latest state) and codes.json (status and owner
+    names by integer code). Arrays are read memory-mapped, so metrics over deltas touch
+    only the changed rows. Days must be recorded in increasing order.
+    """
+
+    def __init__(self, directory=DEAL_HISTORY_DIR, keyframe_days=DEAL_HISTORY_KEYFRAME_DAYS):
+        self.directory = directory
+        self.keyframe_days = keyframe_days
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "deltas"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "keyframes"), exist_ok=True)
+        self._codes = self._load_json("codes.json", {"status": [], "owner": []})
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def _load_json(self, name, default):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return default
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_json(self, name, data):
+        partial = self._path(f"{name}.part")
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(partial, self._path(name))
+
+    def _encode(self, kind, values):
+        """Integer codes for names, extending the code table with new names."""
+        names = self._codes[kind]
+        index = {name: code for code, name in enumerate(names)}
+        for value in pd.unique(values.dropna()):
+            if str(value) not in index:
+                index[str(value)] = len(names)
+                names.append(str(value))
+        return values.map(lambda value: index[str(value)] if pd.notna(value) else ABSENT).to_numpy(dtype="<i4")
+
+    def days(self):
+        """Recorded days as 'YYYY-MM-DD' strings in ascending order."""
+        return sorted(name[:-4] for name in os.listdir(self._path("deltas")) if name.endswith(".npy"))
+
+    def delta(self, day):
+        """The memory-mapped delta of a recorded day."""
+        return np.load(self._path("deltas", f"{day}.npy"), mmap_mode="r")
+
+    def _latest_state(self, days):
+        meta = self._load_json("state.json", {})
+        if days and meta.get("day") == days[-1]:
+            return np.load(self._path("state.npy"))
+        # Сбой между записью дельты и состояния: восстанавливаем по дельтам
+        return self.state(days[-1]) if days else np.empty(0, dtype=STATE_DTYPE)
+
+    def record(self, day, deals):
+        """Stores the deal table of `day` as a delta against the last recorded day.
+
+        `deals` needs id, status_id, responsible_user_id and price columns. Returns the
+        number of changed deals, or None if the day is not after the last recorded one.
+        """
+        day = str(pd.Timestamp(day).date())
+        with self._lock:
+            days = self.days()
+            if days and day <= days[-1]:
+                logging.info(f"Deal history: {day} is not after the last recorded day {days[-1]}, skipped")
+                return None
+            deals = deals.dropna(subset=["id"]).drop_duplicates(subset="id", keep="last")
+            state = np.empty(len(deals), dtype=STATE_DTYPE)
+            state["id"] = deals["id"].astype("int64").to_numpy()
+            state["status"] = self._encode("status", deals["status_id"].astype(object))
+            state["owner"] = self._encode("owner", deals["responsible_user_id"].astype(object))
+            state["price"] = pd.to_numeric(deals["price"], errors="coerce").astype(float).to_numpy()
+            state = state[np.argsort(state["id"], kind="stable")]
+
+            delta = diff_states(self._latest_state(days), state)
+            self._save_json("codes.json", self._codes)
+            _save_atomic(self._path("deltas", f"{day}.npy"), delta)
+            _save_atomic(self._path("state.npy"), state)
+            self._save_json("state.json", {"day": day})
+            keyframes = self._keyframes()
+            if not keyframes or (date.fromisoformat(day) - date.fromisoformat(keyframes[-1])).days >= self.keyframe_days:
+                _save_atomic(self._path("keyframes", f"{day}.npy"), state)
+        logging.info(f"Deal history: recorded {day}, {len(delta)} of {len(state)} deals changed")
+        return len(delta)
+
+    def _keyframes(self):
+        return sorted(name[:-4] for name in os.listdir(self._path("keyframes")) if name.endswith(".npy"))
+
+    def state(self, day):
+        """Raw state array of the deal table as of `day` (the last recorded day not after it)."""
+        day = str(pd.Timestamp(day).date())
+        keyframes = [keyframe for keyframe in self._keyframes() if keyframe <= day]
+        if keyframes:
+            state = np.load(self._path("keyframes", f"{keyframes[-1]}.npy"))
+            start = keyframes[-1]
+        else:
+            state, start = np.empty(0, dtype=STATE_DTYPE), ""
+        for recorded in self.days():
+            if start < recorded <= day:
+                state = apply_delta(state, self.delta(recorded))
+        return state
+
+    def frame(self, day):
+        """The deal table as of `day`: id, status_id, responsible_user_id (categorical), price."""
+        state = self.state(day)
+        return pd.DataFrame({
+            "id": state["id"],
+            "status_id": pd.Categorical.from_codes(state["status"], self._codes["status"]),
+            "responsible_user_id": pd.Categorical.from_codes(state["owner"], self._codes["owner"]),
+            "price": state["price"],
+        })
+
+    def _deltas(self, start=None, end=None):
+        """(day, delta) for recorded days in [start, end]."""
+        start, end = str(start or ""), str(end or "9999-99-99")
+        return [(day, self.delta(day)) for day in self.days() if start <= day <= end]
+
+    def transitions(self, start=None, end=None):
+        """Counts status changes recorded between start and end: {(from, to): count}.
+
+        Deals appearing after the first recorded day count as coming from None; deals of
+        the first recorded day (the initial state) and removed deals are not counted.
+        """
+        days = self.days()
+        counts = {}
+        for day, delta in self._deltas(start, end):
+            if day == days[0]:
+                continue
+            moved = delta[(delta["status"] != delta["prev_status"]) & (delta["status"] != ABSENT)]
+            pairs, numbers = np.unique(np.stack([moved["prev_status"], moved["status"]], axis=1), axis=0, return_counts=True)
+            for (previous, current), number in zip(pairs.tolist(), numbers.tolist()):
+                key = (self._name("status", previous), self._name("status", current))
+                counts[key] = counts.get(key, 0) + number
+        return counts
+
+    def taken_deals(self, start=None, end=None, source="Биржа заявок"):
+        """Deals moved from `source` to an employee between start and end: {employee: count}."""
+        if source not in self._codes["owner"]:
+            return {}
+        source = self._codes["owner"].index(source)
+        counts = {}
+        for _, delta in self._deltas(start, end):
+            taken = delta[(delta["prev_owner"] == source) & (delta["owner"] != source)
+                          & (delta["owner"] != ABSENT) & (delta["status"] != ABSENT)]
+            for owner, number in zip(*np.unique(taken["owner"], return_counts=True)):
+                name = self._name("owner", owner)
+                counts[name] = counts.get(name, 0) + int(number)
+        return counts
+
+    def time_in_stage(self, start=None, end=None):
+        """Days deals spent in a status before leaving it between start and end.
+
+        Returns {status: {"count", "mean_days", "median_days"}}. Only stays with a known
+        entry day count: statuses held on the first recorded day have no entry date.
+        """
+        days = self.days()
+        if not days:
+            return {}
+        day_numbers, ids, statuses = [], [], []
+        for day, delta in self._deltas(None, end):
+            moved = delta[delta["status"] != delta["prev_status"]]
+            day_numbers.append(np.full(len(moved), date.fromisoformat(day).toordinal()))
+            ids.append(np.asarray(moved["id"]))
+            statuses.append(np.asarray(moved["status"]))
+        # Ни одного записанного дня до `end`
+        if not day_numbers:
+            return {}
+        day_numbers, ids, statuses = (np.concatenate(values) for values in (day_numbers, ids, statuses))
+        order = np.lexsort((day_numbers, ids))
+        day_numbers, ids, statuses = day_numbers[order], ids[order], statuses[order]
+
+        # Пара соседних строк одной сделки: вошла в статус в i-1, вышла в i
+        same = ids[1:] == ids[:-1]
+        entered, left = day_numbers[:-1][same], day_numbers[1:][same]
+        stage, target = statuses[:-1][same], statuses[1:][same]
+        first = date.fromisoformat(days[0]).toordinal()
+        lo = date.fromisoformat(str(start)).toordinal() if start else first
+        # Удаление сделки из выгрузки не считается выходом из статуса
+        keep = (entered > first) & (left >= lo) & (stage != ABSENT) & (target != ABSENT)
+        durations, stage = (left - entered)[keep], stage[keep]
+
+        result = {}
+        for code in np.unique(stage):
+            values = durations[stage == code]
+            result[self._name("status", code)] = {
+                "count": int(len(values)),
+                "mean_days": float(values.mean()),
+                "median_days": float(np.median(values)),
+            }
+        return result
+
+    def _name(self, kind, code):
+        return None if code == ABSENT else self._codes[kind][int(code)]
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_deal_history():
+    """Returns the process-wide DealHistory."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = DealHistory()
+        return _history
@@ -0,0 +1,85 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUE_FULL_TEXT = "Сейчас слишком много запросов. Пожалуйста, повторите через пару минут."
+TIMEOUT_TEXT = "Запрос ждал в очереди слишком долго. Пожалуйста, повторите его."
+
+
+class ChatDispatcher:
+    """Runs a message handler on a bounded thread pool.
+
+    Messages of one chat are handled strictly in order, one at a time; different chats
+    run in parallel. When `max_pending` messages are already waiting, new ones get a
+    "queue full" reply, and messages that waited in the queue longer than `queue_timeout`
+    seconds are answered with a timeout notice instead of being handled. The handler
+    itself is not interrupted: it has to bound its own calls.
+    """
+
+    def __init__(self, bot, handler, max_workers=4, max_pending=100, queue_timeout=120):
+        self.bot = bot
+        self.handler = handler
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat")
+        self._queues = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, message):
+        """Queues a message. Returns False if it was rejected because the queue is full."""
+        chat_id = message.chat.id
+        with self._lock:
+            if self._pending >= self.max_pending:
+                rejected = True
+            else:
+                rejected = False
+                self._pending += 1
+                queue = self._queues.get(chat_id)
+                idle = queue is None
+                if idle:
+                    queue = self._queues[chat_id] = deque()
+                queue.append((message, time.monotonic() + self.queue_timeout))
+        if rejected:
+            logging.warning(f"Chat queue full, rejecting message from {chat_id}")
+            self._reply(chat_id, QUEUE_FULL_TEXT)
+            return False
+        if idle:
+            self._executor.submit(self._run_next, chat_id)
+        return True
+
+    def _run_next(self, chat_id):
+        """Handles the oldest message of a chat, then reschedules the chat if more are waiting."""
+        with self._lock:
+            message, deadline = self._queues[chat_id].popleft()
+            self._pending -= 1
+        try:
+            if time.monotonic() > deadline:
+                self._reply(chat_id, TIMEOUT_TEXT)
+            else:
+                self.handler(message)
+        except Exception as e:
+            logging.error(f"Error handling message from {chat_id}: {e}")
+        finally:
+            with self._lock:
+                more = bool(self._queues[chat_id])
+                if not more:
+                    del self._queues[chat_id]
+            if more:
+                self._executor.submit(self._run_next, chat_id)
+
+    def _reply(self, chat_id, text):
+        try:
+            self.bot.send_message(chat_id, text)
+        except Exception as e:
+            logging.error(f"Failed to reply to {chat_id}: {e}")
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
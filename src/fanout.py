@@ -0,0 +1,89 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import increment
+from config import BROADCAST_RATE, BROADCAST_WORKERS, BROADCAST_RETRIES
+
+
+class RateLimiter:
+    """Token bucket shared by threads: `rate` units per `per` seconds, bursts up to `burst` (default `rate`)."""
+
+    def __init__(self, rate, per=1.0, burst=None):
+        self.rate = rate
+        self.per = per
+        self.burst = burst or rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Blocks until `amount` units are available (at most `burst`, so large requests still pass)."""
+        amount = min(amount, self.burst)
+        refill = self.rate / self.per
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * refill)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / refill
+            time.sleep(wait)
+
+
+def chat_unreachable(error):
+    """True if the chat itself is gone: bot blocked or kicked (403) or 400 "chat not found".
+
+    Other 400s (message too long, empty text, ...) are problems of the message, not the chat.
+    """
+    code = getattr(error, "error_code", None)
+    if code == 403:
+        return True
+    return code == 400 and "chat not found" in str(getattr(error, "description", "")).lower()
+
+
+def retry_after(error):
+    """Seconds Telegram asked to wait for a 429 error, or None for any other error."""
+    if getattr(error, "error_code", None) != 429:
+        return None
+    parameters = (getattr(error, "result_json", None) or {}).get("parameters") or {}
+    return float(parameters.get("retry_after", 1))
+
+
+def broadcast(send, chat_ids, text, rate=BROADCAST_RATE, workers=BROADCAST_WORKERS, retries=BROADCAST_RETRIES):
+    """Sends the same text to every chat concurrently within Telegram's rate limit.
+
+    `send(chat_id, text)` is called at most `rate` times per second across all threads.
+    On 429 the chat is retried (up to `retries` times) after the retry_after Telegram returned.
+    Other errors are final: network errors and 5xx were already retried by the transport,
+    and repeating a send that may have been delivered would duplicate the report.
+    Returns {chat_id: exception or None}.
+    """
+    limiter = RateLimiter(rate)
+
+    def deliver(chat_id):
+        for attempt in range(retries + 1):
+            limiter.acquire()
+            try:
+                send(chat_id, text)
+                increment("broadcast.sent")
+                return None
+            except Exception as e:
+                error = e
+                delay = retry_after(e)
+                if attempt == retries or delay is None:
+                    break
+                increment("broadcast.throttled")
+                logging.warning(f"Sending to {chat_id} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        increment("broadcast.failed")
+        logging.error(f"Giving up sending to {chat_id}: {error}")
+        return error
+
+    chat_ids = list(dict.fromkeys(chat_ids))
+    if not chat_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(chat_ids)), thread_name_prefix="broadcast") as executor:
+        return dict(zip(chat_ids, executor.map(deliver, chat_ids)))
@@ -0,0 +1,119 @@
+import os
+import json
+import logging
+import pandas as pd
+from process_csv import parse_datetimes
+from transport import request
+from config import FILE_URL, TEMP_FILE, SNAPSHOT_FILE, SNAPSHOT_META
+
+DOWNLOAD_TIMEOUT = 60
+CHUNK_SIZE = 1 << 16
+EXCLUDED_USERS = {"Муратова Рината"}
+
+
+def fetch_export(url=FILE_URL, path=TEMP_FILE, meta=None, session=None):
+    """Streams the export to `path` with a conditional GET.
+
+    Without `session` the request goes through transport.request (pooled, retried, circuit
+    breaker "export"). Returns the new ETag/Last-Modified headers, or None if the server
+    answered 304 Not Modified.
+    """
+    meta = meta or {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    if session is not None:
+        response = session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    else:
+        response = request("export", "GET", url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    with response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        partial = f"{path}.part"
+        with open(partial, "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+        os.replace(partial, path)
+        return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+
+def read_export(path):
+    """Parses the Excel export into a typed frame with one row per deal."""
+    df = pd.read_excel(path)
+    df = df.iloc[1:]  # Remove the first row
+    df = df[~df["responsible_user_id"].isin(EXCLUDED_USERS)]
+    return coerce_export_types(df)
+
+
+def coerce_export_types(df):
+    """Fixes column types so the frame can be stored as Parquet: int id, float price, datetimes."""
+    df = df.copy()
+    df["id"] = pd.to_numeric(df["id"], errors="coerce")
+    df = df.dropna(subset=["id"])
+    df["id"] = df["id"].astype("int64")
+    if "price" in df.columns:
+        df["price"] = pd.to_numeric(df["price"].astype("string").str.replace(",", "", regex=False), errors="coerce").astype(float)
+    for column in ("created_at", "updated_at", "closed_at"):
+        if column in df.columns:
+            df[column] = parse_datetimes(df[column])
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].map(str).where(df[column].notna(), None)
+    return df.drop_duplicates(subset="id", keep="last").reset_index(drop=True)
+
+
+def load_snapshot(path=SNAPSHOT_FILE):
+    """Returns the stored deal snapshot or None."""
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def _load_meta(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+
+def _write_atomic(path, write):
+    partial = f"{path}.part"
+    write(partial)
+    os.replace(partial, path)
+
+
+def refresh_snapshot(url=FILE_URL, snapshot_path=SNAPSHOT_FILE, meta_path=SNAPSHOT_META, temp_path=TEMP_FILE, session=None):
+    """Downloads the export only if it changed and stores it as the new snapshot.
+
+    The saving is the conditional GET: an unmodified export is neither downloaded nor parsed.
+    A changed one is parsed in full and replaces the snapshot (deals missing from it are gone).
+    Returns the snapshot frame, or None if the export was not modified.
+    """
+    meta = _load_meta(meta_path) if os.path.exists(snapshot_path) else {}
+    try:
+        headers = fetch_export(url, temp_path, meta, session)
+        if headers is None:
+            logging.info("Export not modified since last download, keeping stored snapshot.")
+            return None
+
+        snapshot = read_export(temp_path).sort_values("id").reset_index(drop=True)
+        _write_atomic(snapshot_path, lambda partial: snapshot.to_parquet(partial, index=False))
+        _write_atomic(meta_path, lambda partial: _dump_json(headers, partial))
+        logging.info(f"Snapshot updated: {len(snapshot)} deals.")
+        return snapshot
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+            logging.info(f"Temporary file {temp_path} deleted.")
+
+
+def _dump_json(data, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
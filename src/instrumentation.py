@@ -0,0 +1,212 @@
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("huber.metrics")
+
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_local = threading.local()
+_profiling = False
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """Adds `value` to a counter."""
+    with _lock:
+        key = (name, _label_key(labels))
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, error=False):
+    """Records one timed run of the stage `name`."""
+    with _lock:
+        stats = _spans.setdefault(name, {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0})
+        stats["count"] += 1
+        stats["errors"] += int(error)
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        stats["last_seconds"] = seconds
+
+
+@contextmanager
+def span(name, **fields):
+    """Times a block and logs it as one structured JSON line."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds, error is not None)
+        record = {"event": "span", "name": name, "seconds": round(seconds, 4), "status": "error" if error else "ok", **fields}
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def llm_usage():
+    """Collects the token usage of chat completions made by this thread inside the block.
+
+    Yields {"calls", "reported", "tokens"}: completions sent (cached answers are not),
+    how many of them returned a usage block, and their prompt + completion tokens.
+    """
+    usage = {"calls": 0, "reported": 0, "tokens": 0}
+    previous = getattr(_local, "usage", None)
+    _local.usage = usage
+    try:
+        yield usage
+    finally:
+        _local.usage = previous
+
+
+def record_llm_call(model, seconds, usage=None, cached=False):
+    """Records latency and token usage of one chat completion (usage is response.usage)."""
+    increment("llm_requests_total", model=model, cached=str(cached).lower())
+    if cached:
+        return
+    observe(f"llm.{model}", seconds)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    collected = getattr(_local, "usage", None)
+    if collected is not None:
+        collected["calls"] += 1
+        collected["reported"] += usage is not None
+        collected["tokens"] += prompt_tokens + completion_tokens
+    increment("llm_prompt_tokens_total", prompt_tokens, model=model)
+    increment("llm_completion_tokens_total", completion_tokens, model=model)
+    logger.info(json.dumps({
+        "event": "llm_call", "model": model, "seconds": round(seconds, 4),
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+    }))
+
+
+def snapshot():
+    """Returns a copy of all span stats and counters."""
+    with _lock:
+        return {name: dict(stats) for name, stats in _spans.items()}, dict(_counters)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def render_prometheus():
+    """Renders spans and counters in the Prometheus text exposition format."""
+    spans, counters = snapshot()
+    lines = [
+        "# TYPE huber_stage_seconds_total counter",
+        "# TYPE huber_stage_runs_total counter",
+        "# TYPE huber_stage_errors_total counter",
+        "# TYPE huber_stage_max_seconds gauge",
+        "# TYPE huber_stage_last_seconds gauge",
+    ]
+    for name, stats in sorted(spans.items()):
+        label = _format_labels((("stage", name),))
+        lines += [
+            f"huber_stage_seconds_total{label} {stats['seconds']:.6f}",
+            f"huber_stage_runs_total{label} {stats['count']}",
+            f"huber_stage_errors_total{label} {stats['errors']}",
+            f"huber_stage_max_seconds{label} {stats['max_seconds']:.6f}",
+            f"huber_stage_last_seconds{label} {stats['last_seconds']:.6f}",
+        ]
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f"huber_{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path):
+    """Writes render_prometheus() to `path` atomically (e.g. for the node_exporter textfile collector)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial = f"{path}.part"
+    with open(partial, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(partial, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics on a daemon thread and returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Metrics endpoint on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+@contextmanager
+def profiled(name, directory=None):
+    """Profiles the block with cProfile when `directory` (default: $HUBER_PROFILE_DIR) is set.
+
+    Saves <directory>/<name>-<timestamp>.prof and logs the top functions by cumulative time.
+    Blocks nested in an already profiled one are covered by the outer profile.
+    """
+    global _profiling
+    directory = directory or os.getenv("HUBER_PROFILE_DIR")
+    with _lock:
+        # Второй профилировщик одновременно с первым cProfile не запустит
+        nested, _profiling = _profiling, _profiling or bool(directory)
+    if not directory or nested:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _lock:
+            _profiling = False
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(15)
+        logging.info(f"Profile saved to {path}\n{stream.getvalue()}")
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from instrumentation import record_llm_call
+from config import LLM_CACHE_DB, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    data_version TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+def normalize_text(text):
+    """Lowercases and collapses whitespace so trivially different prompts share a key."""
+    return " ".join(str(text).lower().split())
+
+
+def cache_key(model, messages, data_version, params):
+    payload = {
+        "model": model,
+        "messages": [{"role": m["role"], "content": normalize_text(m["content"])} for m in messages],
+        "data_version": data_version,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Persistent cache of chat completion texts keyed by normalized prompt, model and data version.
+
+    Entries expire after `ttl` seconds; beyond `max_entries` the least recently used are evicted.
+    When a new data version shows up, responses computed for older versions are dropped.
+    """
+
+    def __init__(self, path=LLM_CACHE_DB, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data_version = None
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, key, data_version, response):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, data_version, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, data_version, response, now, now),
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, data_version):
+        """Drops responses computed for any other data version (unversioned ones are kept)."""
+        self._data_version = data_version
+        with self._connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM responses WHERE data_version != '' AND data_version != ?", (data_version,)
+            ).rowcount
+        if deleted:
+            logging.info(f"LLM cache: dropped {deleted} responses for old data versions")
+
+    def complete(self, client, model, messages, data_version="", **params):
+        """Returns the cached completion text or calls client.chat.completions.create and stores it."""
+        data_version = str(data_version or "")
+        if data_version and data_version != self._data_version:
+            self.invalidate(data_version)
+        key = cache_key(model, messages, data_version, params)
+        cached = self.get(key)
+        if cached is not None:
+            record_llm_call(model, 0.0, cached=True)
+            return cached
+        start = time.perf_counter()
+        response = client.chat.completions.create(model=model, messages=messages, **params)
+        record_llm_call(model, time.perf_counter() - start, getattr(response, "usage", None))
+        text = response.choices[0].message.content.strip()
+        self.put(key, data_version, text)
+        return text
+
+    def stats(self):
+        with self._connect() as conn:
+            size = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Returns the process-wide LLMCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def invalidate_llm_cache(data_version):
+    """Drops cached responses for older data versions if this process has opened the cache.
+
+    Called after every history write; a process that opens the cache later invalidates it
+    on its first complete() with the new version.
+    """
+    with _cache_lock:
+        cache = _cache
+    if cache is not None and data_version:
+        cache.invalidate(str(data_version))
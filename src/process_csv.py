@@ -1,7 +1,8 @@
 import os
 import logging
 import pandas as pd
-from config import DEAL_STATUSES, MARGIN_PERCENTAGE
+from config import DEAL_STATUSES, DEAL_STAGE_LABELS, TAKEN_KEY, CLOSED_FAILED_KEY, calculate_margin
+from instrumentation import timed
 
 class Process:
     @staticmethod
@@ -19,18 +20,50 @@ class Process:
             return None
 
     @staticmethod
+    @timed("process.load_deal_frame")
+    def load_deal_frame(df):
+        """Normalizes the export schema once and returns a new typed frame.
+
+        price -> float, created_at/updated_at/closed_at -> datetime, status_id and
+        responsible_user_id -> category, plus derived columns: date (updated_at day),
+        status_category (key of DEAL_STATUSES) and is_closed. The source frame is not modified.
+        """
+        missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+        if missing:
+            logging.error(f"Отсутствуют необходимые колонки: {missing}")
+            return None
+
+        price = df["price"]
+        if not pd.api.types.is_numeric_dtype(price):
+            price = pd.to_numeric(price.astype("string").str.replace(",", "", regex=False), errors="coerce")
+
+        frame = df.assign(
+            price=price.astype(float),
+            created_at=parse_datetimes(df["created_at"]) if "created_at" in df.columns else pd.NaT,
+            updated_at=parse_datetimes(df["updated_at"]),
+            closed_at=parse_datetimes(df["closed_at"]),
+            status_id=df["status_id"].astype("category"),
+            responsible_user_id=df["responsible_user_id"].astype("category"),
+        )
+        frame["date"] = frame["updated_at"].dt.normalize()
+        frame["status_category"] = pd.Categorical(df["status_id"].map(STATUS_CATEGORIES), categories=list(DEAL_STATUSES))
+        frame["is_closed"] = frame["closed_at"].notna()
+        return frame
+
+    @staticmethod
+    @timed("process.calculate_total_revenue")
     def calculate_total_revenue(df):
         """Calculates the total revenue from the 'price' column."""
         if "price" not in df.columns:
             logging.error("Column 'price' not found in CSV file!")
             return None
         
-        df["price"] = df["price"].replace(",", "", regex=True).astype(float)
         total = df["price"].sum()
         margin = calculate_margin(total)
         return float(total), float(margin)
 
     @staticmethod
+    @timed("process.calculate_revenue_per_employee")
     def calculate_revenue_per_employee(df):
         """Calculates the total revenue per employee and returns a dictionary."""
         if "responsible_user_id" not in df.columns or "price" not in df.columns:
@@ -38,78 +71,217 @@ class Process:
             return None
         
         df_filtered = df[df["responsible_user_id"] != "Биржа заявок"]
-        revenue_per_employee = df_filtered.groupby("responsible_user_id")["price"].sum().to_dict()
+        revenue_per_employee = df_filtered.groupby("responsible_user_id", observed=True)["price"].sum().to_dict()
         return revenue_per_employee
     
     @staticmethod
-    def get_deals_details(df, statuses, deal_type):
-        """Extracts deal details for successful or failed deals."""
-        deals = df[df['status_id'].isin(statuses)]
-        details = {
-            f"{deal_type}_id": ';'.join(deals['id'].astype(str)),
-            f"{deal_type}_name": ';'.join(deals['name'].astype(str)),
-            f"{deal_type}_price": ';'.join(deals['price'].astype(str)),
-            f"{deal_type}_created_at": ';'.join(deals['created_at'].astype(str)),
-            f"{deal_type}_updated_at": ';'.join(deals['updated_at'].astype(str)),
-            f"{deal_type}_responsible_user_id": ';'.join(deals['responsible_user_id'].astype(str)),
-        }
-        return details
+    @timed("process.get_deals_records")
+    def get_deals_records(df, statuses):
+        """Extracts successful or failed deals as records with a numeric price."""
+        return deal_records(df[df['status_id'].isin(statuses)])
 
     @staticmethod
+    @timed("process.count_deal_stages")
     def count_deal_stages(df):
         """Подсчитывает количество успешных, проваленных и находящихся в работе сделок."""
         
-        if "status_id" not in df.columns:
-            logging.error("В DataFrame отсутствует колонка 'status_id'!")
+        if "status_category" not in df.columns:
+            logging.error("В DataFrame отсутствует колонка 'status_category'!")
             return None
 
-        # Определяем категории сделок
-        successful_stages = DEAL_STATUSES["successful"]
-        failed_stages = DEAL_STATUSES["failed"]
-        in_progress_stages = DEAL_STATUSES["in_progress"]
-
-        # Подсчитываем количество сделок по категориям
-        successful_count = df["status_id"].isin(successful_stages).sum()
-        failed_count = df["status_id"].isin(failed_stages).sum()
-        in_progress_count = df["status_id"].isin(in_progress_stages).sum()
-
-        return {
-            "Успешные сделки": successful_count,
-            "Проваленные сделки": failed_count,
-            "Сделки в работе": in_progress_count
-        }
+        # Категории статусов уже вычислены при загрузке
+        counts = df["status_category"].value_counts()
+        return {label: int(counts.get(category, 0)) for category, label in DEAL_STAGE_LABELS.items()}
 
     @staticmethod
+    @timed("process.calculate_employee_activity")
     def calculate_employee_activity(df):
         """Подсчитывает активность сотрудников: взятые, закрытые и нереализованные сделки."""
         
-        if "responsible_user_id" not in df.columns or "updated_at" not in df.columns or "closed_at" not in df.columns:
+        if "responsible_user_id" not in df.columns or "is_closed" not in df.columns:
             logging.error("Отсутствуют необходимые колонки!")
             return None
-        # df["closed_at"] = df["closed_at"].replace("не закрыта", pd.NA)
-        # Преобразуем даты в формат datetime для работы с ними
-        df["updated_at"] = pd.to_datetime(df["updated_at"], format="%d.%m.%Y %H:%M:%S", errors="coerce")
-        df["closed_at"] = pd.to_datetime(df["closed_at"], format="%d.%m.%Y %H:%M:%S", errors="coerce")
 
-        # Отбираем сделки, которые были переведены с "Биржа заявок" на конкретного сотрудника
-        df["Количество сделок, взятые в работу сотрудником"] = (df["responsible_user_id"] != "Биржа заявок")
+        activity_summary = pd.DataFrame({
+            # Сделки, которые были переведены с "Биржа заявок" на конкретного сотрудника
+            TAKEN_KEY: df["responsible_user_id"] != "Биржа заявок",
+            # Нереализованные сделки (закрытые со статусом "ЗАКРЫТО И НЕ РЕАЛИЗОВАНО")
+            CLOSED_FAILED_KEY: df["is_closed"] & (df["status_id"] == "ЗАКРЫТО И НЕ РЕАЛИЗОВАНО"),
+        }).groupby(df["responsible_user_id"], observed=True).sum()
 
-        # Закрытые сделки (есть дата закрытия)
-        df["closed_at"] = df["closed_at"].notna()
-
-        # Нереализованные сделки (закрытые со статусом "ЗАКРЫТО И НЕ РЕАЛИЗОВАНО")
-        df["Закрытая и Нереализованная сделка"] = df["closed_at"] & (df["status_id"] == "ЗАКРЫТО И НЕ РЕАЛИЗОВАНО")
-
-        # Группируем по ответственным сотрудникам
-        activity_summary = df.groupby("responsible_user_id").agg(
-            {"Количество сделок, взятые в работу сотрудником": "sum", "Закрытая и Нереализованная сделка": "sum"}
-        )
-        print(activity_summary)
         # Преобразуем в словарь для удобства
         activity_summary_dict = activity_summary.to_dict(orient="index")
         return activity_summary_dict
 
+    @staticmethod
+    @timed("process.calculate_daily_metrics")
+    def calculate_daily_metrics(df):
+        """Считает метрики всех дней за один проход groupby по (дата, сотрудник, категория статуса).
+
+        Ожидает кадр из load_deal_frame. Возвращает список записей в порядке появления дат —
+        с тем же содержимым, что и расчёт по каждому дню отдельно.
+        """
+        if "date" not in df.columns or "status_category" not in df.columns:
+            logging.error("Ожидается DataFrame из Process.load_deal_frame!")
+            return None
+
+        df = df[df["date"].notna()]
+        return build_daily_entries(group_daily_metrics(df), df["date"].unique(), daily_deals_records(df))
+
+    @staticmethod
+    @timed("process.stream_daily_metrics")
+    def stream_daily_metrics(path, chunksize=None, exclude_users=(), keep_deals=True, on_deals=None):
+        """Same result as calculate_daily_metrics(load_deal_frame(...)), reading the export in chunks.
+
+        Only the columns the metrics use are read (CSV or Parquet). Each chunk is folded into
+        running sums per (date, employee, status category), so memory does not grow with the
+        file. Deal records do grow with the number of successful/failed deals; with
+        keep_deals=False they are skipped and entries carry no 'deals' key. `on_deals(date, deals)`
+        is called for every date of every chunk, so records can be written out as they come.
+        """
+        grouped = None
+        dates = {}
+        deals = {}
+        for chunk in iter_export_chunks(path, chunksize or STREAM_CHUNK_ROWS):
+            frame = Process.load_deal_frame(chunk)
+            if frame is None:
+                return None
+            frame = frame[frame["date"].notna() & ~frame["responsible_user_id"].isin(exclude_users)]
+            dates.update(dict.fromkeys(frame["date"].unique()))
+            partial = group_daily_metrics(frame)
+            grouped = partial if grouped is None else (
+                pd.concat([grouped, partial]).groupby(level=[0, 1, 2], dropna=False, observed=True).sum()
+            )
+            if keep_deals or on_deals:
+                for date, kinds in iter_daily_deals_records(frame):
+                    if on_deals:
+                        on_deals(date, kinds)
+                    if keep_deals:
+                        day = deals.setdefault(date, {"successful": [], "failed": []})
+                        for kind, records in kinds.items():
+                            day[kind].extend(records)
+
+        if grouped is None:
+            return []
+        entries = build_daily_entries(grouped, list(dates), deals)
+        if not keep_deals:
+            for entry in entries:
+                del entry["deals"]
+        return entries
+
+
+def group_daily_metrics(df):
+    """Sums price, deal count and closed-failed count per (date, employee, status category)."""
+    # Сделки "Биржа заявок" не участвуют в метриках, только в деталях
+    work = df[df["responsible_user_id"] != "Биржа заявок"]
+    return pd.DataFrame({
+        "price": work["price"],
+        "closed_failed": work["is_closed"] & (work["status_id"] == "ЗАКРЫТО И НЕ РЕАЛИЗОВАНО"),
+    }).groupby(
+        [work["date"], work["responsible_user_id"], work["status_category"]], dropna=False, observed=True
+    ).agg(price=("price", "sum"), deals=("price", "size"), closed_failed=("closed_failed", "sum"))
+
+
+def build_daily_entries(grouped, dates, deals):
+    """Turns group_daily_metrics sums into cumulative report entries, in the order of `dates`."""
+    totals = grouped["price"].groupby(level=0).sum().to_dict()
+    stages = grouped["deals"].groupby(level=[0, 2], observed=True).sum().to_dict()
+    # groupby по уровням отбрасывает NaN в responsible_user_id, как и поштучный расчёт
+    per_employee = grouped.groupby(level=[0, 1], observed=True).sum().to_dict(orient="index")
+
+    employees = {}
+    for (date, employee), values in per_employee.items():
+        employees.setdefault(date, {})[employee] = values
+
+    entries = []
+    for date in dates:
+        total_revenue = float(totals.get(date, 0.0))
+        day_employees = employees.get(date, {})
+        entries.append({
+            "updated_at": date.strftime("%Y-%m-%d"),
+            "total_revenue": total_revenue,
+            "margin": float(calculate_margin(total_revenue)),
+            "total_revenue_per_employee": {
+                employee: float(values["price"]) for employee, values in day_employees.items()
+            },
+            "deal_counts": {
+                label: int(stages.get((date, category), 0))
+                for category, label in DEAL_STAGE_LABELS.items()
+            },
+            "employee_activity": {
+                employee: {
+                    TAKEN_KEY: int(values["deals"]),
+                    CLOSED_FAILED_KEY: int(values["closed_failed"]),
+                }
+                for employee, values in day_employees.items()
+            },
+            "deals": deals.get(date, {"successful": [], "failed": []}),
+        })
+    return entries
+
+
+# Категория ("successful"/"failed"/"in_progress") для каждого статуса сделки
+STATUS_CATEGORIES = {status: category for category, statuses in DEAL_STATUSES.items() for status in statuses}
+
+DEAL_DETAIL_COLUMNS = ["id", "name", "price", "created_at", "updated_at", "responsible_user_id"]
+
+REQUIRED_COLUMNS = ["id", "price", "status_id", "responsible_user_id", "updated_at", "closed_at"]
+
+# Колонки, которые читает потоковый режим, и размер порции (строк)
+STREAM_COLUMNS = REQUIRED_COLUMNS + ["name", "created_at"]
+STREAM_CHUNK_ROWS = 200_000
+
+
+def iter_export_chunks(path, chunksize=STREAM_CHUNK_ROWS):
+    """Yields the export (CSV or Parquet) in frames of at most `chunksize` rows, metric columns only."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        columns = [column for column in STREAM_COLUMNS if column in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, encoding="utf-8", usecols=lambda column: column in STREAM_COLUMNS,
+                           dtype=str, chunksize=chunksize)
+
+
+def deal_records(deals):
+    """Converts deal rows to JSON-ready records: int id, float price (None if missing), string dates."""
+    frame = deals[DEAL_DETAIL_COLUMNS].astype(object)
+    for column in ("created_at", "updated_at"):
+        if pd.api.types.is_datetime64_any_dtype(deals[column]):
+            frame[column] = deals[column].dt.strftime("%Y-%m-%d %H:%M:%S").astype(object)
+    frame["id"] = deals["id"].astype("int64").astype(object)
+    return frame.where(deals[DEAL_DETAIL_COLUMNS].notna(), None).to_dict(orient="records")
+
+
+def daily_deals_records(df):
+    """Successful and failed deal records for every date of the 'date' column, in one groupby."""
+    return dict(iter_daily_deals_records(df))
+
+
+def iter_daily_deals_records(df):
+    """Yields (date, {"successful": records, "failed": records}) one date at a time."""
+    deals = df[df["status_category"].isin(["successful", "failed"])]
+    groups = deals.groupby(["date", "status_category"], observed=True, sort=False).indices
+    for date in df["date"].unique():
+        yield date, {
+            kind: deal_records(deals.iloc[groups[(date, kind)]]) if (date, kind) in groups else []
+            for kind in ("successful", "failed")
+        }
+
 
-def calculate_margin(total):
-    margin = MARGIN_PERCENTAGE
-    return total * margin
\ No newline at end of file
+def parse_datetimes(series):
+    """Parses an export date column: Excel serial numbers, 'DD.MM.YYYY HH:MM:SS' or ISO strings."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    numeric = pd.to_numeric(series, errors="coerce")
+    # В to_datetime(unit=...) передаются только числа: на NaN pandas изредка падает с FloatingPointError
+    serial = numeric.notna()
+    parsed = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+    if serial.any():
+        parsed[serial] = pd.to_datetime(numeric[serial], unit="D", origin="1899-12-30", errors="coerce")
+    text = series.where(numeric.isna()).astype("string")
+    parsed = parsed.fillna(pd.to_datetime(text, format="%d.%m.%Y %H:%M:%S", errors="coerce"))
+    parsed = parsed.fillna(pd.to_datetime(text, format="ISO8601", errors="coerce"))
+    return parsed
@@ -0,0 +1,169 @@
+import re
+import json
+import math
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from config import PROMPT_TOKEN_BUDGET, PROMPT_RECENT_DAYS, DEAL_STAGE_LABELS, TAKEN_KEY, CLOSED_FAILED_KEY
+from instrumentation import increment
+
+# Грубая оценка токенов без токенизатора: сколько символов в среднем приходится на токен
+TOKEN_PATTERN = re.compile(r"(\d+)|([A-Za-z]+)|([А-Яа-яЁё]+)|\S")
+CHARS_PER_TOKEN = (3, 4, 2.5)
+
+DAY_COLUMNS = "date|rev|mgn|ok|fail|work"
+EMPLOYEE_COLUMNS = "emp|rev|taken|cf"
+LEGEND = ("Таблицы через '|': date — дата или период, rev — выручка (тенге), mgn — прибыль (тенге), "
+          "ok/fail/work — успешные/проваленные/в работе сделки, emp — сотрудник, "
+          "taken — взято в работу, cf — закрыто и не реализовано, ok_sum — сумма успешных, eff — эффективность.")
+
+
+def estimate_tokens(text):
+    """Offline token estimate: digits ~3, Latin ~4 and Cyrillic ~2.5 characters per token, other symbols 1."""
+    tokens = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        for group, chars in zip(match.groups(), CHARS_PER_TOKEN):
+            if group:
+                tokens += math.ceil(len(group) / chars)
+                break
+        else:
+            tokens += 1
+    return tokens
+
+
+@dataclass
+class PromptData:
+    """Serialized data for a prompt plus how much it was compressed."""
+    text: str
+    tokens: int
+    raw_tokens: int
+    level: int
+    days: int
+
+    @property
+    def ratio(self):
+        return self.raw_tokens / self.tokens if self.tokens else 1.0
+
+
+def day_row(label, entries):
+    """One 'date|rev|mgn|ok|fail|work' row summing `entries`, numbers rounded to whole units."""
+    values = [
+        sum(entry.get("total_revenue") or 0.0 for entry in entries),
+        sum(entry.get("margin") or 0.0 for entry in entries),
+    ] + [sum((entry.get("deal_counts") or {}).get(key, 0) for entry in entries) for key in DEAL_STAGE_LABELS.values()]
+    return "|".join([label] + [str(round(value)) for value in values])
+
+
+def employee_rows(entries, label=None):
+    """'emp|rev|taken|cf' rows summed over `entries`; with `label` the row starts with it."""
+    totals = {}
+    for entry in entries:
+        for employee, revenue in (entry.get("total_revenue_per_employee") or {}).items():
+            totals.setdefault(employee, [0.0, 0, 0])[0] += revenue or 0.0
+        for employee, activity in (entry.get("employee_activity") or {}).items():
+            values = totals.setdefault(employee, [0.0, 0, 0])
+            values[1] += activity.get(TAKEN_KEY, 0)
+            values[2] += activity.get(CLOSED_FAILED_KEY, 0)
+    prefix = [label] if label else []
+    return ["|".join(prefix + [employee] + [str(round(value)) for value in values])
+            for employee, values in sorted(totals.items())]
+
+
+def group_entries(entries, period):
+    """Splits entries into consecutive (label, entries) groups by ISO week or month."""
+    groups = []
+    for entry in entries:
+        day = date.fromisoformat(entry["updated_at"])
+        key = day - timedelta(days=day.weekday()) if period == "week" else day.replace(day=1)
+        if groups and groups[-1][0] == key:
+            groups[-1][1].append(entry)
+        else:
+            groups.append((key, [entry]))
+    return [(f"{group[0]['updated_at']}..{group[-1]['updated_at']}", group) for _, group in groups]
+
+
+def render_tables(entries, level, recent=PROMPT_RECENT_DAYS):
+    """Renders entries at a degradation level.
+
+    0: days and employees per day; 1: days, employees for the whole period;
+    2: older days by week; 3: older days by month. The last `recent` days stay daily.
+    """
+    if level >= 2:
+        older, latest = entries[:-recent] if recent else entries, entries[-recent:] if recent else []
+        groups = group_entries(older, "week" if level == 2 else "month")
+        groups += [(entry["updated_at"], [entry]) for entry in latest]
+    else:
+        groups = [(entry["updated_at"], [entry]) for entry in entries]
+    lines = [f"Дни ({DAY_COLUMNS}):"] + [day_row(label, group) for label, group in groups]
+    if level == 0:
+        lines.append(f"Сотрудники по дням (date|{EMPLOYEE_COLUMNS}):")
+        for entry in entries:
+            lines.extend(employee_rows([entry], entry["updated_at"]))
+    else:
+        lines.append(f"Сотрудники за весь период ({EMPLOYEE_COLUMNS}):")
+        lines.extend(employee_rows(entries))
+    return "\n".join(lines)
+
+
+def render_history(entries, level, first=None):
+    """Prompt text for `entries` at a degradation level, headed by the covered date range.
+
+    `first` is the first day of the full history; if the entries start later, the header
+    says the older days were left out.
+    """
+    if not entries:
+        return "Нет данных."
+    start, end = entries[0]["updated_at"], entries[-1]["updated_at"]
+    header = f"Период данных: {start}..{end} ({len(entries)} дн.)."
+    if first and first < start:
+        header += (f" История начинается с {first}, но дни до {start} не поместились в запрос и опущены: "
+                   f"ответы «за всё время» относятся только к этому периоду, скажи об этом.")
+    return f"{header}\n{LEGEND}\n{render_tables(entries, level)}"
+
+
+def build_history_data(entries, budget=PROMPT_TOKEN_BUDGET):
+    """Serializes daily entries into compact tables that fit `budget` estimated tokens.
+
+    Detail is reduced step by step (see render_tables); if even monthly rows do not fit,
+    the oldest months are dropped and the text says which range it covers. Deal lists
+    are never included.
+    """
+    raw = json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+    raw_tokens = estimate_tokens(raw)
+    entries = list(entries)
+    first = entries[0]["updated_at"] if entries else None
+    level = 0
+    while True:
+        text = render_history(entries, level, first)
+        tokens = estimate_tokens(text)
+        if tokens <= budget or len(entries) <= 1:
+            break
+        if level < 3:
+            level += 1
+            continue
+        # Отбрасываем самый старый месяц целиком
+        oldest = entries[0]["updated_at"][:7]
+        entries = [entry for entry in entries if entry["updated_at"][:7] != oldest] or entries[-1:]
+    data = PromptData(text, tokens, raw_tokens, level, len(entries))
+    increment("prompt.tokens", tokens)
+    increment("prompt.tokens_saved", max(0, raw_tokens - tokens))
+    logging.info(f"Prompt data: {tokens} tokens instead of {raw_tokens} (x{data.ratio:.1f}), "
+                 f"level {level}, {data.days} days")
+    return data
+
+
+def build_report_data(metrics):
+    """Serializes report.compute_report_metrics output as two compact tables."""
+    lines = [
+        f"Итоги ({DAY_COLUMNS}):",
+        "|".join([str(metrics.get("date") or "")] + [str(round(metrics[key])) for key in
+                                                    ("total_revenue", "margin", "successful", "failed", "in_progress")]),
+        "Сотрудники (emp|ok|ok_sum|taken|cf|eff%):",
+    ]
+    for employee, values in metrics["employees"].items():
+        efficiency = "-" if values["efficiency"] is None else str(round(values["efficiency"]))
+        lines.append("|".join([employee, str(values["successful_count"]), str(round(values["successful_sum"])),
+                               str(values["taken"]), str(values["closed_failed"]), efficiency]))
+    text = "\n".join(lines)
+    increment("prompt.tokens", estimate_tokens(text))
+    return text
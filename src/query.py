@@ -0,0 +1,421 @@
+import re
+import logging
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from report import format_money, rank_employees
+from llm_cache import get_llm_cache
+from storage import metric_vector
+from prompt import build_history_data
+from config import PROMPT_TOKEN_BUDGET, DEAL_STAGE_LABELS, TAKEN_KEY, CLOSED_FAILED_KEY, calculate_margin
+
+MONTHS = {
+    "январ": 1, "феврал": 2, "март": 3, "апрел": 4, "ма": 5, "июн": 6,
+    "июл": 7, "август": 8, "сентябр": 9, "октябр": 10, "ноябр": 11, "декабр": 12,
+}
+# "ма" (май/мая/мае) без окончаний, чтобы не путать с "маржа"
+MONTH_PATTERN = re.compile(r"\b(январ|феврал|март|апрел|ма(?=[йяе]\b)|июн|июл|август|сентябр|октябр|ноябр|декабр)[а-я]*\b")
+MONTH_NAMES = ["Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+               "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"]
+DATE_PATTERN = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b|\b(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?\b")
+LAST_DAYS_PATTERN = re.compile(r"(?:за\s+)?(?:последние\s+)?(\d+)\s+(?:дн|день|сут)")
+LAST_WEEKS_PATTERN = re.compile(r"(?:за\s+)?(?:последние\s+)?(\d+)?\s*недел")
+WORD_PATTERN = re.compile(r"[а-яёa-z]+")
+# "не реализованы" -> "нереализованы": отрицание склеивается со словом до поиска основ
+NEGATION_PATTERN = re.compile(r"\bне\s+(?=[а-яё])")
+VOWELS = "аеёиоуыэюя"
+
+# Основы слов метрик в порядке приоритета; совпадение только с начала слова,
+# поэтому "нереализованных" не находится по "реализован". Отрицательные формы идут раньше.
+METRIC_KEYWORDS = [
+    ("ranking", ("лучш", "худш", "рейтинг")),
+    ("margin", ("марж", "прибыл")),
+    ("successful_sum", (r"сумм\w* успешн", r"сумм\w* реализован")),
+    ("revenue", ("выручк", "оборот", "доход", "сумм")),
+    ("failed", ("провал", "нереализ", "неуспешн")),
+    ("successful", ("успешн", "реализован")),
+    ("in_progress", ("в работе",)),
+    ("activity", ("активност", "взял", "взят")),
+    ("deals", ("сдел", "продаж")),
+]
+METRIC_PATTERNS = [(name, re.compile(r"\b(?:" + "|".join(stems) + ")")) for name, stems in METRIC_KEYWORDS]
+
+# Метрики, которые сравниваются по периодам (None — выручка по умолчанию)
+COMPARE_METRICS = (None, "revenue", "margin", "successful", "failed", "in_progress", "deals")
+
+
+@dataclass
+class Intent:
+    metric: str
+    start: date
+    end: date
+    employee: str = None
+    # Для сравнения: список периодов (start, end), start/end тогда охватывают их все
+    periods: tuple = ()
+
+
+class History:
+    """Daily report entries indexed by date for range lookups.
+
+    With `totals` (a CumulativeStore) range sums come from its prefix-sum index instead of
+    walking the entries.
+    """
+
+    def __init__(self, entries, version="", deals=None, totals=None):
+        self.version = version
+        # Читатель таблицы сделок (CumulativeStore.deals), подгружает только нужные колонки и дни
+        self.deals = deals
+        self.totals = totals
+        self.entries = sorted(entries, key=lambda entry: entry["updated_at"])
+        self.dates = [entry["updated_at"] for entry in self.entries]
+        self.employees = sorted({
+            employee
+            for entry in self.entries
+            for employee in list(entry.get("total_revenue_per_employee") or {}) + list(entry.get("employee_activity") or {})
+        })
+
+    def range(self, start, end):
+        """Returns entries with start <= updated_at <= end (dates or 'YYYY-MM-DD' strings)."""
+        lo = bisect_left(self.dates, str(start))
+        hi = bisect_right(self.dates, str(end))
+        return self.entries[lo:hi]
+
+    def span(self, start, end):
+        """(first date, last date, number of days) stored within [start, end], or None."""
+        lo = bisect_left(self.dates, str(start))
+        hi = bisect_right(self.dates, str(end))
+        if lo == hi:
+            return None
+        return self.dates[lo], self.dates[hi - 1], hi - lo
+
+    def total(self, metric, start, end, employee=""):
+        """Sum of a storage.metric_vector series over [start, end]."""
+        if self.totals is not None:
+            return self.totals.range_total(metric, str(start), str(end), employee)
+        return sum(metric_vector(entry).get((metric, employee), 0.0) for entry in self.range(start, end))
+
+    def totals_by_employee(self, metric, start, end):
+        """{employee: total} of a per-employee series over [start, end], zero totals omitted."""
+        if self.totals is not None:
+            return self.totals.range_totals_by_employee(metric, str(start), str(end))
+        totals = {}
+        for entry in self.range(start, end):
+            for (name, employee), value in metric_vector(entry).items():
+                if name == metric and employee:
+                    totals[employee] = totals.get(employee, 0.0) + value
+        return {employee: total for employee, total in totals.items() if total}
+
+
+def parse_period(text, today):
+    """Extracts a (start, end) date period from a question, or None if none is mentioned.
+
+    "Последние N дней" are the N days ending yesterday, since today's report is not ready yet.
+    """
+    yesterday = today - timedelta(days=1)
+    if "позавчера" in text:
+        day = today - timedelta(days=2)
+        return day, day
+    if "вчера" in text:
+        return yesterday, yesterday
+    if "сегодня" in text:
+        return today, today
+
+    match = LAST_DAYS_PATTERN.search(text)
+    if match:
+        return yesterday - timedelta(days=int(match.group(1)) - 1), yesterday
+    match = LAST_WEEKS_PATTERN.search(text)
+    if match:
+        weeks = int(match.group(1) or 1)
+        return yesterday - timedelta(days=7 * weeks - 1), yesterday
+
+    dates = []
+    for match in DATE_PATTERN.finditer(text):
+        if match.group(1):
+            year, month, day = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        else:
+            year = int(match.group(6)) if match.group(6) else today.year
+            month, day = int(match.group(5)), int(match.group(4))
+        try:
+            dates.append(date(year, month, day))
+        except ValueError:
+            continue
+    if dates:
+        return min(dates), max(dates)
+
+    if "прошл" in text and "месяц" in text:
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end
+    months = [MONTHS[match.group(1)] for match in MONTH_PATTERN.finditer(text)]
+    if months:
+        periods = [month_period(month, today) for month in months]
+        return min(start for start, _ in periods), max(end for _, end in periods)
+    if "месяц" in text:
+        return yesterday - timedelta(days=29), yesterday
+    if "всё время" in text or "все время" in text:
+        return date.min, yesterday
+    return None
+
+
+def month_period(month, today):
+    """Returns the first and last day of the latest `month` that is not in the future."""
+    year = today.year if month <= today.month else today.year - 1
+    start = date(year, month, 1)
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+def name_stem(word):
+    """A name without its final vowel: "ирина" and "ирины" share "ирин"."""
+    return word[:-1] if word[-1] in VOWELS else word
+
+
+def find_employee(text, employees):
+    """First employee whose surname or name starts a word of the question, or None.
+
+    Only whole words count ("каким" is not "Ким"). Names are compared by stem plus up to
+    two letters of case ending ("Иванова", "Киму", "Ирины" for "Ирина").
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    for name in employees:
+        for part in name.lower().split():
+            stem = name_stem(part)
+            if len(stem) > 2 and any(word.startswith(stem) and len(word) - len(stem) <= 2 for word in words):
+                return name
+    return None
+
+
+def parse_question(text, employees=(), today=None):
+    """Parses a question into an Intent, or returns None if it needs free-form analysis."""
+    text = text.lower()
+    today = today or datetime.now().date()
+    # Объяснения, прогнозы и тренды разбираются LLM
+    if any(word in text for word in ("почему", "прогноз", "динамик", "тренд")):
+        return None
+    metrics = [name for name, pattern in METRIC_PATTERNS if pattern.search(NEGATION_PATTERN.sub("не", text))]
+    metric = metrics[0] if metrics else None
+    if metric in DEAL_STAGE_LABELS and len(set(metrics) & set(DEAL_STAGE_LABELS)) > 1:
+        metric = "deals"
+    employee = find_employee(text, employees)
+    if "сравни" in text:
+        # Локально сравниваются только названные месяцы: "сравни февраль и март"
+        months = list(dict.fromkeys(MONTHS[match.group(1)] for match in MONTH_PATTERN.finditer(text)))
+        if len(months) < 2 or metric not in COMPARE_METRICS:
+            return None
+        periods = tuple(sorted(month_period(month, today) for month in months))
+        return Intent(metric or "revenue", periods[0][0], periods[-1][1], employee, periods)
+    period = parse_period(text, today)
+    if period is None or metric is None:
+        return None
+    return Intent(metric, period[0], period[1], employee)
+
+
+def format_period(start, end, span):
+    """Formats the stored days of a History.span, or [start, end] when there are none."""
+    if not span:
+        return f"{start:%d.%m.%Y}–{end:%d.%m.%Y}"
+    first = datetime.strptime(span[0], "%Y-%m-%d")
+    last = datetime.strptime(span[1], "%Y-%m-%d")
+    if first == last:
+        return f"{first:%d.%m.%Y}"
+    return f"{first:%d.%m.%Y}–{last:%d.%m.%Y}"
+
+
+def count_employee_deals(history, kind, employee, start, end):
+    """Counts `employee`'s successful or failed deals between start and end."""
+    if history.deals is None:
+        return 0
+    owners = history.deals(columns=["responsible_user_id"], start=str(start), end=str(end), kind=kind)
+    return sum(1 for owner in owners["responsible_user_id"] if owner == employee)
+
+
+def successful_sum(history, start, end, employee=None):
+    """(count, sum) of successful deals between start and end, of one employee or of all."""
+    if history.deals is None:
+        return 0, 0.0
+    deals = history.deals(columns=["responsible_user_id", "price"], start=str(start), end=str(end), kind="successful")
+    prices = [price or 0.0 for owner, price in zip(deals["responsible_user_id"], deals["price"])
+              if (owner == employee if employee else owner != "Биржа заявок")]
+    return len(prices), sum(prices)
+
+
+def employee_scores(history, start, end):
+    """{employee: (successful deals, their sum)} between start and end, as in the daily report.
+
+    Employees who only took deals in the period score (0, 0.0).
+    """
+    scores = {employee: (0, 0.0) for employee in history.totals_by_employee("taken", start, end)}
+    if history.deals is not None:
+        deals = history.deals(columns=["responsible_user_id", "price"], start=str(start), end=str(end), kind="successful")
+        for employee, price in zip(deals["responsible_user_id"], deals["price"]):
+            count, total = scores.get(employee, (0, 0.0))
+            scores[employee] = (count + 1, total + (price or 0.0))
+    scores.pop("Биржа заявок", None)
+    return scores
+
+
+def answer_ranking(intent, history, period):
+    """Ranks employees like the daily report: by successful deals, then by their sum."""
+    scores = employee_scores(history, intent.start, intent.end)
+    if not scores:
+        return f"Нет данных по сотрудникам за {period}."
+    best, worst, all_equal = rank_employees(scores)
+    ranked = sorted(scores.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+    lines = [f"{place}. {employee}: успешных сделок — {count}, сумма — {format_money(total)} тенге"
+             for place, (employee, (count, total)) in enumerate(ranked, 1)]
+    if all_equal:
+        lines.append("Результаты у всех сотрудников одинаковые.")
+    else:
+        lines.append(f"Лучший: {', '.join(best)}")
+        if worst:
+            lines.append(f"Худший: {', '.join(worst)}")
+    return f"Рейтинг сотрудников за {period} (по успешным сделкам, затем по их сумме):\n" + "\n".join(lines)
+
+
+def answer_intent(intent, history):
+    """Computes the answer for a parsed intent from the history. Returns Russian text."""
+    if intent.periods:
+        return answer_comparison(intent, history)
+    span = history.span(intent.start, intent.end)
+    if not span:
+        return f"Нет данных за период {format_period(intent.start, intent.end, span)}."
+    period = format_period(intent.start, intent.end, span)
+    days = span[2]
+    who = f" сотрудника {intent.employee}" if intent.employee else ""
+
+    if intent.metric in ("revenue", "margin"):
+        revenue = history.total("revenue" if intent.employee else "total_revenue", intent.start, intent.end, intent.employee or "")
+        if intent.metric == "margin":
+            if intent.employee:
+                margin = calculate_margin(revenue)
+            else:
+                margin = history.total("margin", intent.start, intent.end)
+            return (f"Прибыль{who} за {period}: {format_money(margin)} тенге "
+                    f"при обороте {format_money(revenue)} тенге (дней с данными: {days}).")
+        return (f"Выручка{who} за {period}: {format_money(revenue)} тенге "
+                f"(дней с данными: {days}, в среднем {format_money(revenue / days)} тенге в день).")
+
+    if intent.metric == "ranking":
+        return answer_ranking(intent, history, period)
+
+    if intent.metric == "activity" or (intent.employee and intent.metric in ("deals", "in_progress")):
+        activity = {}
+        for entry in history.range(intent.start, intent.end):
+            for employee, values in (entry.get("employee_activity") or {}).items():
+                if intent.employee and employee != intent.employee:
+                    continue
+                totals = activity.setdefault(employee, [0, 0])
+                totals[0] += values.get(TAKEN_KEY, 0)
+                totals[1] += values.get(CLOSED_FAILED_KEY, 0)
+        if not activity:
+            return f"Нет данных об активности{who} за {period}."
+        lines = [f"- {employee}: взято в работу — {taken}, закрыто и не реализовано — {failed}"
+                 for employee, (taken, failed) in sorted(activity.items())]
+        return f"Активность сотрудников за {period}:\n" + "\n".join(lines)
+
+    if intent.metric == "successful_sum":
+        count, total = successful_sum(history, intent.start, intent.end, intent.employee)
+        return f"Сумма успешных сделок{who} за {period}: {format_money(total)} тенге (сделок: {count})."
+
+    if intent.employee and intent.metric in ("successful", "failed"):
+        count = count_employee_deals(history, intent.metric, intent.employee, intent.start, intent.end)
+        label = "Успешных" if intent.metric == "successful" else "Проваленных"
+        return f"{label} сделок{who} за {period}: {count}."
+
+    counts = {key: int(history.total(metric, intent.start, intent.end)) for metric, key in DEAL_STAGE_LABELS.items()}
+    if intent.metric in DEAL_STAGE_LABELS:
+        key = DEAL_STAGE_LABELS[intent.metric]
+        return f"{key} за {period}: {counts[key]}."
+    return f"Сделки за {period}:\n" + "\n".join(f"- {key}: {value}" for key, value in counts.items())
+
+
+def answer_comparison(intent, history):
+    """Compares a metric across intent.periods (whole months) using range totals."""
+    metric = intent.metric
+    employee = intent.employee or ""
+    who = f" сотрудника {employee}" if employee else ""
+    lines = []
+    previous = None
+    for start, end in intent.periods:
+        span = history.span(start, end)
+        name = f"{MONTH_NAMES[start.month - 1]} {start.year}"
+        if not span:
+            lines.append(f"- {name}: нет данных")
+            continue
+        if metric in ("revenue", "margin"):
+            if employee:
+                value = history.total("revenue", start, end, employee)
+                value = calculate_margin(value) if metric == "margin" else value
+            else:
+                value = history.total("total_revenue" if metric == "revenue" else "margin", start, end)
+            text = f"{format_money(value)} тенге"
+        elif metric == "deals":
+            counts = {key: int(history.total(stage, start, end)) for stage, key in DEAL_STAGE_LABELS.items()}
+            value = sum(counts.values())
+            text = ", ".join(f"{key.lower()} — {count}" for key, count in counts.items())
+        else:
+            value = int(history.total(metric, start, end))
+            text = str(value)
+        if previous:
+            text += f" ({(value - previous) / previous * 100:+.1f}% к предыдущему)"
+        previous = value
+        lines.append(f"- {name} (дней с данными: {span[2]}): {text}")
+    label = {"margin": "Прибыль", "deals": "Сделки"}.get(metric) or DEAL_STAGE_LABELS.get(metric, "Выручка")
+    return f"{label}{who} по месяцам:\n" + "\n".join(lines)
+
+
+def compact_entries(entries):
+    """Strips deal lists from entries so they fit into a single LLM prompt."""
+    keys = ("updated_at", "total_revenue", "margin", "total_revenue_per_employee", "deal_counts", "employee_activity")
+    return [{key: entry.get(key) for key in keys} for entry in entries]
+
+
+def ask_llm(client, question, history, budget=PROMPT_TOKEN_BUDGET, today=None):
+    """Single LLM call for free-form questions.
+
+    The period named in the question (or the whole history) is serialized by
+    prompt.build_history_data within `budget` estimated tokens.
+    """
+    today = today or datetime.now().date()
+    period = parse_period(question.lower(), today)
+    entries = history.range(*period) if period else history.entries
+    data = build_history_data(compact_entries(entries), budget)
+    prompt = f"""
+        Ответь на вопрос по данным отдела продаж.
+        Всегда прибыль считай в тенге. Вчера было {today - timedelta(days=1):%Y-%m-%d}.
+
+        Вопрос: {question}
+        Данные:
+{data.text}
+
+        Формат ответа:
+        - Краткий вывод в начале
+        - Подробное объяснение с расчетами
+        - Основные выводы в конце
+        """
+    return get_llm_cache().complete(
+        client,
+        "gpt-4",
+        [
+            {"role": "system", "content": "Ты финансовый аналитик. Отвечай на русском."},
+            {"role": "user", "content": prompt}
+        ],
+        data_version=history.version,
+        temperature=0.1
+    )
+
+
+def answer_question(question, history, client=None, today=None, before_llm=None):
+    """Answers locally when the question is recognized, otherwise with one LLM call.
+
+    Without `client` unrecognized questions return None. `before_llm` is called right
+    before the LLM request (e.g. to tell the user to wait).
+    """
+    intent = parse_question(question, history.employees, today)
+    if intent is not None:
+        logging.info(f"Answering locally: {intent}")
+        return answer_intent(intent, history)
+    if client is None:
+        return None
+    if before_llm is not None:
+        before_llm()
+    return ask_llm(client, question, history, today=today)
@@ -0,0 +1,165 @@
+import logging
+from string import Template
+from config import (get_openai_client, calculate_margin, format_russian_date, MARGIN_PERCENTAGE, REPORT_NARRATIVE,
+                    DEAL_STAGE_LABELS, TAKEN_KEY, CLOSED_FAILED_KEY)
+from llm_cache import get_llm_cache
+from instrumentation import timed
+from prompt import LEGEND, build_report_data
+
+REPORT_TEMPLATE = Template("""$title
+1. Общий оборот отдела продаж: $revenue тенге (продаж: $sales_count)
+2. Маржинальность $margin_percent%: оборот $revenue тенге, прибыль $margin тенге
+3. Сделки: успешных — $successful, проваленных (закрыто и не реализовано) — $failed, в работе — $in_progress
+4. $ranking
+5. Активность сотрудников:
+$activity
+6. Эффективность сотрудников (успешные / взятые в работу × 100):
+$efficiency""")
+
+
+def compute_report_metrics(data_summary):
+    """Computes every number of the daily report locally from the data summary.
+
+    Best and worst employee are ranked by the number of successful deals, then by their sum.
+    If all employees have equal results there is no worst one, and one employee is never both.
+    """
+    total_revenue = float(data_summary["total_revenue"] or 0.0)
+    deal_counts = data_summary.get("deal_counts") or {}
+    activity = data_summary.get("employee_activity") or {}
+    successful_deals = data_summary.get("successful_deals") or {}
+
+    employees = sorted(set(activity) | set(successful_deals) | set(data_summary.get("total_revenue_per_employee") or {}))
+    per_employee = {}
+    for employee in employees:
+        successful = successful_deals.get(employee, {})
+        count = int(successful.get("successful_deals", 0))
+        taken = int(activity.get(employee, {}).get(TAKEN_KEY, 0))
+        per_employee[employee] = {
+            "successful_count": count,
+            "successful_sum": float(successful.get("price", 0.0)),
+            "taken": taken,
+            "closed_failed": int(activity.get(employee, {}).get(CLOSED_FAILED_KEY, 0)),
+            "efficiency": count / taken * 100 if taken else None,
+        }
+
+    best, worst, all_equal = rank_employees(
+        {employee: (values["successful_count"], values["successful_sum"]) for employee, values in per_employee.items()}
+    )
+
+    return {
+        "date": data_summary.get("date"),
+        "total_revenue": total_revenue,
+        "margin": float(calculate_margin(total_revenue)),
+        "successful": int(deal_counts.get(DEAL_STAGE_LABELS["successful"], 0)),
+        "failed": int(deal_counts.get(DEAL_STAGE_LABELS["failed"], 0)),
+        "in_progress": int(deal_counts.get(DEAL_STAGE_LABELS["in_progress"], 0)),
+        "employees": per_employee,
+        "best": best,
+        "worst": worst,
+        "all_equal": all_equal,
+    }
+
+
+def rank_employees(scores):
+    """Best and worst employees by score: (number of successful deals, their sum).
+
+    Returns (best, worst, all_equal); with equal results there is neither best nor worst.
+    """
+    if not scores:
+        return [], [], False
+    top, bottom = max(scores.values()), min(scores.values())
+    best = [employee for employee, score in scores.items() if score == top]
+    if top == bottom:
+        all_equal = len(scores) > 1
+        return ([] if all_equal else best), [], all_equal
+    worst = [employee for employee, score in scores.items() if score == bottom]
+    return best, worst, False
+
+
+def format_money(value):
+    """Formats an amount as '1 000 000'."""
+    return f"{value:,.0f}".replace(",", " ")
+
+
+def render_report(metrics):
+    """Renders the report metrics as Russian text."""
+    employees = metrics["employees"]
+
+    def describe(names):
+        return ", ".join(
+            f"{name} (успешных сделок: {employees[name]['successful_count']}, сумма: {format_money(employees[name]['successful_sum'])} тенге)"
+            for name in names
+        )
+
+    if not employees:
+        ranking = "Лучший и худший сотрудник: нет данных по сотрудникам"
+    elif metrics["all_equal"]:
+        ranking = f"Все сотрудники показали одинаковые результаты: {describe(sorted(employees))}"
+    else:
+        ranking = f"Лучший сотрудник: {describe(metrics['best'])}"
+        ranking += f"; худший сотрудник: {describe(metrics['worst'])}" if metrics["worst"] else "; худшего сотрудника нет"
+
+    activity = "\n".join(
+        f"   - {name}: взято в работу — {values['taken']}, закрыто и не реализовано — {values['closed_failed']}"
+        for name, values in employees.items()
+    ) or "   - нет активности"
+    efficiency = "\n".join(
+        f"   - {name}: {values['efficiency']:.1f}% ({values['successful_count']} из {values['taken']})"
+        if values["efficiency"] is not None else f"   - {name}: нет взятых сделок"
+        for name, values in employees.items()
+    ) or "   - нет данных"
+
+    title = f"Отчёт за {format_russian_date(metrics['date'])}" if metrics.get("date") else "Отчёт за день"
+    return REPORT_TEMPLATE.substitute(
+        title=title,
+        revenue=format_money(metrics["total_revenue"]),
+        sales_count=metrics["successful"],
+        margin_percent=round(MARGIN_PERCENTAGE * 100),
+        margin=format_money(metrics["margin"]),
+        successful=metrics["successful"],
+        failed=metrics["failed"],
+        in_progress=metrics["in_progress"],
+        ranking=ranking,
+        activity=activity,
+        efficiency=efficiency,
+    )
+
+
+NARRATIVE_MAX_TOKENS = 200
+
+
+def narrative_messages(metrics):
+    """Chat messages asking for a short commentary on report metrics."""
+    return [
+        {"role": "system", "content": "You are a marketing specialist assistant. Answer always in Russian."},
+        {"role": "user", "content": "Напиши краткий вывод (2-3 предложения) по итогам дня. "
+                                    f"Не пересчитывай цифры, используй только их.\n{LEGEND}\n{build_report_data(metrics)}"},
+    ]
+
+
+def generate_narrative(metrics):
+    """Asks the LLM for a short commentary on already computed report metrics."""
+    return get_llm_cache().complete(
+        get_openai_client(),
+        "gpt-4",
+        narrative_messages(metrics),
+        max_tokens=NARRATIVE_MAX_TOKENS,
+    )
+
+
+@timed("generate_report")
+def generate_report(data_summary, narrative=REPORT_NARRATIVE, raise_errors=False):
+    """Builds the daily report locally; optionally appends a short LLM narrative.
+
+    A failed narrative is logged and left out, or raised with raise_errors=True.
+    """
+    metrics = compute_report_metrics(data_summary)
+    report = render_report(metrics)
+    if narrative:
+        try:
+            report += f"\n\nВывод: {generate_narrative(metrics)}"
+        except Exception as e:
+            if raise_errors:
+                raise
+            logging.error(f"Narrative generation failed: {e}")
+    return report
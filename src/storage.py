@@ -0,0 +1,456 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from llm_cache import invalidate_llm_cache
+from config import CUMULATIVE_DB, CUMULATIVE_JSON, DEAL_STAGE_LABELS, TAKEN_KEY, CLOSED_FAILED_KEY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_reports (
+    updated_at TEXT PRIMARY KEY,
+    entry TEXT NOT NULL,
+    saved_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deals (
+    report_date TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT,
+    price REAL,
+    created_at TEXT,
+    updated_at TEXT,
+    responsible_user_id TEXT,
+    PRIMARY KEY (report_date, kind, id)
+);
+CREATE TABLE IF NOT EXISTS daily_metrics (
+    metric TEXT NOT NULL,
+    employee TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value REAL NOT NULL,
+    cumulative REAL NOT NULL,
+    PRIMARY KEY (metric, employee, date)
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    employee TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (period, metric, employee, period_start)
+);
+"""
+
+# Сделки дня хранятся отдельной таблицей: kind — "successful" или "failed"
+DEAL_KINDS = ("successful", "failed")
+DEAL_COLUMNS = ("report_date", "kind", "id", "name", "price", "created_at", "updated_at", "responsible_user_id")
+LEGACY_DEAL_FIELDS = ("id", "name", "price", "created_at", "updated_at", "responsible_user_id")
+
+
+# Ряды для префиксных сумм и недельных/месячных агрегатов: (метрика, сотрудник), "" — весь отдел.
+# "days" = 1 за каждый сохранённый день, чтобы считать средние за период.
+ROLLUP_PERIODS = ("week", "month")
+# Начиная с такого числа дней в одном upsert префиксные суммы и агрегаты пересчитываются
+# одним проходом оконной функции вместо обновления по дню
+ROLLUP_REBUILD_DAYS = 30
+
+
+def metric_vector(entry):
+    """Flattens an entry into {(metric, employee): value} for the rollup tables."""
+    vector = {
+        ("days", ""): 1.0,
+        ("total_revenue", ""): float(entry.get("total_revenue") or 0.0),
+        ("margin", ""): float(entry.get("margin") or 0.0),
+    }
+    deal_counts = entry.get("deal_counts") or {}
+    for metric, label in DEAL_STAGE_LABELS.items():
+        vector[(metric, "")] = float(deal_counts.get(label, 0))
+    for employee, revenue in (entry.get("total_revenue_per_employee") or {}).items():
+        vector[("revenue", employee)] = float(revenue or 0.0)
+    for employee, activity in (entry.get("employee_activity") or {}).items():
+        vector[("taken", employee)] = float(activity.get(TAKEN_KEY, 0))
+        vector[("closed_failed", employee)] = float(activity.get(CLOSED_FAILED_KEY, 0))
+    return vector
+
+
+def period_start(date, period):
+    """First day ('YYYY-MM-DD') of the week (Monday) or month containing `date`."""
+    day = datetime.strptime(date, "%Y-%m-%d").date()
+    if period == "week":
+        return (day - timedelta(days=day.weekday())).isoformat()
+    return day.replace(day=1).isoformat()
+
+
+def deal_rows_of(date, deals):
+    """Rows of the deals table for one day's {kind: [records]}."""
+    return [
+        (date, kind, record["id"], record.get("name"), record.get("price"), record.get("created_at"),
+         record.get("updated_at"), record.get("responsible_user_id"))
+        for kind, records in deals.items()
+        for record in records
+    ]
+
+
+def parse_price(value):
+    try:
+        price = float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+    return None if price != price else price
+
+
+def split_legacy_details(entry):
+    """Turns the old `;`-joined `<kind>_deals_<field>` strings of an entry into deal records.
+
+    Returns the entry without those keys and {kind: [record, ...]}. Lists whose lengths
+    disagree (e.g. a deal name containing ';') keep only the fields that line up with the ids.
+    """
+    entry = dict(entry)
+    deals = {}
+    for kind in DEAL_KINDS:
+        if f"{kind}_deals_id" not in entry:
+            continue
+        columns = {field: entry.pop(f"{kind}_deals_{field}", "") or "" for field in LEGACY_DEAL_FIELDS}
+        ids = columns["id"].split(";") if columns["id"] else []
+        values = {}
+        for field, joined in columns.items():
+            parts = joined.split(";") if joined else []
+            if len(parts) == len(ids):
+                values[field] = parts
+            else:
+                logging.warning(f"{entry.get('updated_at')}: {kind} deal field '{field}' does not match ids, skipped")
+                values[field] = [None] * len(ids)
+        deals[kind] = [
+            {
+                "id": int(float(deal_id)),
+                "name": values["name"][i],
+                "price": parse_price(values["price"][i]),
+                "created_at": values["created_at"][i],
+                "updated_at": values["updated_at"][i],
+                "responsible_user_id": values["responsible_user_id"][i],
+            }
+            for i, deal_id in enumerate(ids)
+        ]
+    return entry, deals
+
+
+class CumulativeStore:
+    """Daily report history in SQLite, indexed by `updated_at` (one row per day).
+
+    Writes go through the WAL journal in a single transaction, so a crash never leaves
+    a half-written history, and saving a day that already exists replaces it.
+    """
+
+    def __init__(self, path=CUMULATIVE_DB, legacy_json=CUMULATIVE_JSON):
+        self.path = path
+        self.legacy_json = legacy_json
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Версия данных уникальна для файла: пересозданная база начнёт счётчик заново с другим id
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+        self._build_rollups()
+        self._migrate_legacy_json()
+        self._migrate_deal_details()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def upsert(self, entries, completed=None):
+        """Inserts or replaces entries by their `updated_at` date in one transaction.
+
+        Deal records (entry["deals"], or the legacy `;`-joined fields) replace the day's rows in
+        the deals table; entries without them leave stored deals untouched. The stored entry
+        keeps only the daily metrics. `completed` ('YYYY-MM-DD') moves the last_completed()
+        checkpoint forward in the same transaction.
+        """
+        saved_at = datetime.now().isoformat(timespec="seconds")
+        reports, deal_dates, deal_rows = [], [], []
+        # По датам: каждый день вставляется после уже сохранённых и сдвигает меньше префиксных сумм
+        for entry in sorted(entries, key=lambda entry: entry["updated_at"]):
+            entry, deals = split_legacy_details(entry)
+            if "deals" in entry:
+                deals.update(entry.pop("deals") or {})
+            date = entry["updated_at"]
+            reports.append((date, json.dumps(entry, ensure_ascii=False), saved_at))
+            if deals:
+                deal_dates.append((date,))
+            deal_rows.extend(deal_rows_of(date, deals))
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO daily_reports (updated_at, entry, saved_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(updated_at) DO UPDATE SET entry = excluded.entry, saved_at = excluded.saved_at",
+                reports,
+            )
+            vectors = {date: metric_vector(json.loads(entry)) for date, entry, _ in reports}
+            if len(vectors) >= ROLLUP_REBUILD_DAYS:
+                self._rebuild_rollups(conn, vectors)
+            else:
+                for date, vector in vectors.items():
+                    self._update_rollups(conn, date, vector)
+            conn.executemany("DELETE FROM deals WHERE report_date = ?", deal_dates)
+            conn.executemany(f"INSERT OR REPLACE INTO deals ({', '.join(DEAL_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             deal_rows)
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('version', '1') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+            if completed:
+                self._mark_completed(conn, completed)
+        for date, _, _ in reports:
+            logging.info(f"Updated cumulative report for {date}")
+        invalidate_llm_cache(self.version())
+
+    def add_deals(self, deals, replace=()):
+        """Writes deal records ({date: {kind: [records]}}) without touching the daily reports.
+
+        Rows of the same day are added to the stored ones; days in `replace` are cleared first,
+        so a day whose deals come in several chunks is cleared on its first chunk only.
+        """
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM deals WHERE report_date = ?", [(str(date),) for date in replace])
+            conn.executemany(f"INSERT OR REPLACE INTO deals ({', '.join(DEAL_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             [row for date, kinds in deals.items() for row in deal_rows_of(str(date), kinds)])
+
+    def _update_rollups(self, conn, date, vector):
+        """Applies the difference between the stored and the new metrics of `date`.
+
+        Appending the latest day touches one row per series; replacing an older day also
+        shifts the prefix sums of the later days of the changed series.
+        """
+        old = {
+            (metric, employee): value
+            for metric, employee, value in conn.execute(
+                "SELECT metric, employee, value FROM daily_metrics WHERE date = ?", (date,)
+            )
+        }
+        starts = {period: period_start(date, period) for period in ROLLUP_PERIODS}
+        for series in set(old) | set(vector):
+            metric, employee = series
+            value = vector.get(series, 0.0)
+            delta = value - old.get(series, 0.0)
+            if series in old:
+                if not delta:
+                    continue
+                conn.execute(
+                    "UPDATE daily_metrics SET value = ?, cumulative = cumulative + ? "
+                    "WHERE metric = ? AND employee = ? AND date = ?",
+                    (value, delta, metric, employee, date),
+                )
+            else:
+                previous = conn.execute(
+                    "SELECT cumulative FROM daily_metrics WHERE metric = ? AND employee = ? AND date < ? "
+                    "ORDER BY date DESC LIMIT 1",
+                    (metric, employee, date),
+                ).fetchone()
+                conn.execute(
+                    "INSERT INTO daily_metrics (metric, employee, date, value, cumulative) VALUES (?, ?, ?, ?, ?)",
+                    (metric, employee, date, value, (previous[0] if previous else 0.0) + value),
+                )
+            if delta:
+                conn.execute(
+                    "UPDATE daily_metrics SET cumulative = cumulative + ? WHERE metric = ? AND employee = ? AND date > ?",
+                    (delta, metric, employee, date),
+                )
+                conn.executemany(
+                    "INSERT INTO rollups (period, period_start, metric, employee, value) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(period, metric, employee, period_start) DO UPDATE SET value = value + excluded.value",
+                    [(period, start, metric, employee, delta) for period, start in starts.items()],
+                )
+
+    def _rebuild_rollups(self, conn, vectors):
+        """Replaces the metrics of the days in `vectors` ({date: metric_vector}) and recomputes
+        every prefix sum and rollup in one pass.
+        """
+        conn.executemany("DELETE FROM daily_metrics WHERE date = ?", [(date,) for date in vectors])
+        conn.executemany(
+            "INSERT INTO daily_metrics (metric, employee, date, value, cumulative) VALUES (?, ?, ?, ?, 0)",
+            [(metric, employee, date, value) for date, vector in vectors.items() for (metric, employee), value in vector.items()],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO daily_metrics (metric, employee, date, value, cumulative) "
+            "SELECT metric, employee, date, value, SUM(value) OVER (PARTITION BY metric, employee ORDER BY date) "
+            "FROM daily_metrics"
+        )
+        conn.execute("DELETE FROM rollups")
+        # Неделя начинается с понедельника, как в period_start
+        for period, start in (("week", "date(date, '-6 days', 'weekday 1')"), ("month", "substr(date, 1, 7) || '-01'")):
+            conn.execute(
+                "INSERT INTO rollups (period, period_start, metric, employee, value) "
+                f"SELECT ?, {start} AS period_start, metric, employee, SUM(value) FROM daily_metrics "
+                "WHERE value != 0 GROUP BY period_start, metric, employee",
+                (period,),
+            )
+
+    def _cumulative(self, conn, metric, employee, date, inclusive):
+        row = conn.execute(
+            f"SELECT cumulative FROM daily_metrics WHERE metric = ? AND employee = ? AND date {'<=' if inclusive else '<'} ? "
+            "ORDER BY date DESC LIMIT 1",
+            (metric, employee, date),
+        ).fetchone()
+        return row[0] if row else 0.0
+
+    def range_total(self, metric, start=None, end=None, employee=""):
+        """Sum of a metric over [start, end] from the prefix sums: two index lookups.
+
+        Metrics: days, total_revenue, margin, successful, failed, in_progress, and per
+        employee revenue, taken, closed_failed.
+        """
+        start, end = str(start or ""), str(end or "9999-99-99")
+        with self._connect() as conn:
+            return self._cumulative(conn, metric, employee, end, True) - self._cumulative(conn, metric, employee, start, False)
+
+    def range_totals_by_employee(self, metric, start=None, end=None):
+        """{employee: range_total(metric, start, end, employee)} for every employee with that metric."""
+        start, end = str(start or ""), str(end or "9999-99-99")
+        with self._connect() as conn:
+            employees = [row[0] for row in conn.execute(
+                "SELECT DISTINCT employee FROM daily_metrics WHERE metric = ? AND employee != ''", (metric,)
+            )]
+            totals = {
+                employee: self._cumulative(conn, metric, employee, end, True) - self._cumulative(conn, metric, employee, start, False)
+                for employee in employees
+            }
+        return {employee: total for employee, total in totals.items() if total}
+
+    def range_average(self, metric, start=None, end=None, employee=""):
+        """Average per stored day over [start, end], or None if there are no days."""
+        days = self.range_total("days", start, end)
+        return self.range_total(metric, start, end, employee) / days if days else None
+
+    def rollups(self, period, metric, start=None, end=None, employee=""):
+        """Weekly or monthly totals as [(period_start, value)] for periods starting in [start, end]."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT period_start, value FROM rollups WHERE period = ? AND metric = ? AND employee = ? "
+                "AND period_start >= ? AND period_start <= ? ORDER BY period_start",
+                (period, metric, employee, str(start or ""), str(end or "9999-99-99")),
+            ).fetchall()
+
+    def _build_rollups(self):
+        """One-time fill of the rollup tables for a history saved before they existed."""
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'rollups_built'").fetchone():
+                return
+            conn.execute("DELETE FROM daily_metrics")
+            rows = conn.execute("SELECT updated_at, entry FROM daily_reports ORDER BY updated_at").fetchall()
+            self._rebuild_rollups(conn, {date: metric_vector(json.loads(entry)) for date, entry in rows})
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups_built', '1')")
+        if rows:
+            logging.info(f"Built rollups for {len(rows)} days")
+
+    def version(self):
+        """Returns '<store id>:<counter>', changing with every upsert ('' for an empty store).
+
+        The store id is random per database file, so a rebuilt database never repeats
+        the versions of the old one.
+        """
+        with self._connect() as conn:
+            rows = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('store_id', 'version')").fetchall())
+        return f"{rows['store_id']}:{rows['version']}" if "version" in rows else ""
+
+    def _mark_completed(self, conn, date):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('last_completed', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+            (str(date),),
+        )
+
+    def mark_completed(self, date):
+        """Moves the last_completed() checkpoint forward without changing the history."""
+        with self._connect() as conn:
+            self._mark_completed(conn, date)
+
+    def last_completed(self):
+        """Latest 'YYYY-MM-DD' up to which every day has been processed, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'last_completed'").fetchone()
+        return row[0] if row else None
+
+    def get(self, date):
+        """Returns the entry for a 'YYYY-MM-DD' date or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT entry FROM daily_reports WHERE updated_at = ?", (date,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def dates(self):
+        """Returns all stored dates in ascending order."""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT updated_at FROM daily_reports ORDER BY updated_at")]
+
+    def entries(self, start=None, end=None):
+        """Returns entries ordered by date, optionally limited to [start, end] (inclusive)."""
+        query = "SELECT entry FROM daily_reports WHERE updated_at >= ? AND updated_at <= ? ORDER BY updated_at"
+        with self._connect() as conn:
+            rows = conn.execute(query, (start or "", end or "9999-99-99")).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def deals(self, columns=None, start=None, end=None, kind=None):
+        """Reads deal records column-wise: {column: [values]} for days in [start, end].
+
+        Only the requested `columns` are loaded; `kind` limits to "successful" or "failed".
+        """
+        columns = list(columns or DEAL_COLUMNS)
+        unknown = set(columns) - set(DEAL_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown deal columns: {sorted(unknown)}")
+        query = f"SELECT {', '.join(columns)} FROM deals WHERE report_date >= ? AND report_date <= ?"
+        params = [start or "", end or "9999-99-99"]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY report_date, kind, id", params).fetchall()
+        return {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+
+    def _migrate_legacy_json(self):
+        """One-time import of the old cumulative_report.json; later duplicates of a day win."""
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_migrated'").fetchone():
+                return
+        data = []
+        if self.legacy_json and os.path.exists(self.legacy_json) and os.path.getsize(self.legacy_json) > 0:
+            try:
+                with open(self.legacy_json, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except json.JSONDecodeError as e:
+                logging.error(f"Legacy JSON decode error: {e}. Skipping migration.")
+            if not isinstance(data, list):
+                logging.warning("Corrupted legacy JSON structure. Skipping migration.")
+                data = []
+        if data:
+            self.upsert(data)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_json_migrated', ?)",
+                         (str(len(data)),))
+        logging.info(f"Migrated {len(data)} entries from {self.legacy_json}")
+
+    def _migrate_deal_details(self):
+        """Moves `;`-joined deal fields of entries saved before the deals table into it."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT entry FROM daily_reports WHERE entry LIKE ?", ('%"successful_deals_id"%',)).fetchall()
+        if rows:
+            self.upsert([json.loads(row[0]) for row in rows])
+            logging.info(f"Moved deal details of {len(rows)} entries into the deals table")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide CumulativeStore."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CumulativeStore()
+        return _store
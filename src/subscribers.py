@@ -0,0 +1,66 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from config import SUBSCRIBERS_DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    chat_id INTEGER PRIMARY KEY,
+    title TEXT,
+    subscribed_at REAL NOT NULL
+);
+"""
+
+
+class SubscriberRegistry:
+    """Persistent set of chats that receive the daily report."""
+
+    def __init__(self, path=SUBSCRIBERS_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, chat_id, title=None):
+        """Subscribes a chat. Returns False if it was already subscribed."""
+        with self._connect() as conn:
+            added = conn.execute(
+                "INSERT OR IGNORE INTO subscribers (chat_id, title, subscribed_at) VALUES (?, ?, ?)",
+                (int(chat_id), title, time.time()),
+            ).rowcount
+        if added:
+            logging.info(f"Chat {chat_id} subscribed to the daily report")
+        return bool(added)
+
+    def remove(self, chat_id):
+        """Unsubscribes a chat. Returns False if it was not subscribed."""
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM subscribers WHERE chat_id = ?", (int(chat_id),)).rowcount
+        if removed:
+            logging.info(f"Chat {chat_id} unsubscribed from the daily report")
+        return bool(removed)
+
+    def chat_ids(self):
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT chat_id FROM subscribers ORDER BY subscribed_at")]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_subscribers():
+    """Returns the process-wide SubscriberRegistry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SubscriberRegistry()
+        return _registry
@@ -0,0 +1,193 @@
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from instrumentation import increment
+from config import (HTTP_TIMEOUT, HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_BACKOFF, HTTP_MAX_BACKOFF,
+                    BREAKER_FAILURES, BREAKER_RESET, OPENAI_TIMEOUT)
+
+# Ответы, после которых запрос повторяется; 429 обрабатывают вызывающие (retry_after)
+RETRY_STATUSES = {500, 502, 503, 504}
+# Остальные методы (POST sendMessage) после обрыва или таймаута чтения не повторяются:
+# сервер мог уже принять запрос, и повтор отправил бы отчёт дважды
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without a network call while a service's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a service after `failures` consecutive failures.
+
+    While open, calls fail immediately. After `reset` seconds one trial call is let
+    through (half-open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset = reset
+        self._count = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info(f"Circuit breaker {self.name}: closed")
+            self._count = 0
+            self._opened_at = None
+            self._trial = False
+
+    def release(self):
+        """Ends a half-open trial that failed with a local error (no verdict on the service)."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._count += 1
+            if self._trial or (self._opened_at is None and self._count >= self.failures):
+                self._opened_at = time.monotonic()
+                self._trial = False
+                increment("transport.circuit_opened", service=self.name)
+                logging.warning(f"Circuit breaker {self.name}: open for {self.reset}s after {self._count} failures")
+
+
+def backoff_delay(attempt, base=HTTP_BACKOFF, cap=HTTP_MAX_BACKOFF):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+_breakers = {}
+_session = None
+_lock = threading.Lock()
+
+
+def not_sent(error):
+    """True if a requests error happened before the request reached the server (connect failure)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def get_breaker(service):
+    """Returns the circuit breaker shared by all calls to `service`."""
+    with _lock:
+        if service not in _breakers:
+            _breakers[service] = CircuitBreaker(service)
+        return _breakers[service]
+
+
+def get_session():
+    """Returns the process-wide requests.Session with keep-alive connection pools."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def request(service, method, url, retries=HTTP_RETRIES, idempotent=None, **kwargs):
+    """session.request with a default timeout, retries and the service's circuit breaker.
+
+    Connection errors, timeouts and 5xx answers are retried with jittered exponential
+    backoff and count as breaker failures. Non-idempotent requests (by default anything
+    but IDEMPOTENT_METHODS) are retried only on 5xx and on errors before they were sent.
+    After the last attempt the error is raised, or the last 5xx response is returned.
+    Raises CircuitOpenError while the breaker is open.
+    """
+    breaker = get_breaker(service)
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(f"{service}: circuit breaker is open")
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            breaker.record_failure()
+            if attempt == retries or not (idempotent or not_sent(e)):
+                raise
+            reason = str(e)
+        except BaseException:
+            # Иначе пробный вызов half-open остался бы незавершённым и предохранитель не закрылся бы
+            breaker.release()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt == retries:
+                return response
+            reason = f"HTTP {response.status_code}"
+            response.close()
+        delay = backoff_delay(attempt)
+        increment("transport.retries", service=service)
+        logging.warning(f"{service}: {method} failed ({reason}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+        time.sleep(delay)
+
+
+def telegram_request_sender(method, url, **kwargs):
+    """telebot.apihelper.CUSTOM_REQUEST_SENDER that goes through request("telegram", ...)."""
+    return request("telegram", method, url, **kwargs)
+
+
+def openai_http_client(service="openai"):
+    """httpx.Client for the OpenAI SDK: pooled connections and a circuit breaker.
+
+    Retries are left to the SDK (max_retries); connection errors and 5xx answers count
+    as breaker failures, and while the breaker is open requests fail as connection errors.
+    """
+    import httpx
+
+    breaker = get_breaker(service)
+
+    class BreakerTransport(httpx.HTTPTransport):
+        def handle_request(self, http_request):
+            if not breaker.allow():
+                raise httpx.ConnectError(f"{service}: circuit breaker is open", request=http_request)
+            try:
+                response = super().handle_request(http_request)
+            except httpx.TransportError:
+                breaker.record_failure()
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+            if response.status_code in RETRY_STATUSES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+    limits = httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+    return httpx.Client(transport=BreakerTransport(limits=limits), timeout=OPENAI_TIMEOUT)
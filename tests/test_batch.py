@@ -0,0 +1,113 @@
+import time
+from datetime import date, timedelta
+
+import openai
+import pytest
+
+import batch
+import config
+import llm_cache
+import transport
+from batch import BatchResults, run_batch
+from config import DEAL_STAGE_LABELS, TAKEN_KEY, CLOSED_FAILED_KEY
+from fake_openai import start_server
+from storage import CumulativeStore
+
+
+def entry(day, i):
+    return {
+        "updated_at": day,
+        "total_revenue": 1000.0 * i,
+        "margin": 200.0 * i,
+        "total_revenue_per_employee": {"Анна": 1000.0 * i},
+        "deal_counts": {DEAL_STAGE_LABELS["successful"]: 1, DEAL_STAGE_LABELS["failed"]: 0},
+        "employee_activity": {"Анна": {TAKEN_KEY: 2, CLOSED_FAILED_KEY: 0}},
+        "deals": {"successful": [{"id": i, "name": f"Сделка {i}", "price": 1000.0 * i, "created_at": day,
+                                  "updated_at": day, "responsible_user_id": "Анна"}]},
+    }
+
+
+@pytest.fixture
+def fake_api(tmp_path, monkeypatch):
+    """Stored days, an empty results DB and the OpenAI client pointed at benchmarks/fake_openai.py."""
+    servers = []
+
+    def start(latency=0.0, days=6):
+        server = start_server(0, latency=latency)
+        servers.append(server)
+        monkeypatch.setattr(transport, "_breakers", {})
+        client = openai.OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+                               max_retries=0, http_client=transport.openai_http_client())
+        monkeypatch.setattr(config, "_openai_client", client)
+        monkeypatch.setattr(llm_cache, "_cache", llm_cache.LLMCache(str(tmp_path / "llm_cache.db")))
+        store = CumulativeStore(str(tmp_path / "report.db"), legacy_json=None)
+        dates = [(date(2025, 1, 1) + timedelta(days=i)).isoformat() for i in range(days)]
+        store.upsert([entry(day, i + 1) for i, day in enumerate(dates)])
+        return server.RequestHandlerClass.accepted, store, dates, BatchResults(str(tmp_path / "batch.db"))
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_batch_resumes_without_repeating_reports(fake_api):
+    accepted, store, dates, results = fake_api()
+    first = run_batch(dates[:4], store, results, workers=4, rpm=6000, tpm=10_000_000)
+    assert (first.done, first.failed, first.skipped) == (4, 0, 0)
+    assert len(accepted) == 4
+    assert all("Синтетический вывод" in report for report in results.reports().values())
+
+    second = run_batch(dates, store, results, workers=4, rpm=6000, tpm=10_000_000)
+    assert (second.done, second.skipped) == (2, 4)
+    assert len(accepted) == 6
+    assert sorted(results.reports()) == dates
+
+
+def test_batch_counts_tokens_from_usage(fake_api):
+    accepted, store, dates, results = fake_api(days=2)
+    stats = run_batch(dates, store, results, workers=2, rpm=6000, tpm=10_000_000)
+    # fake_openai считает prompt_tokens как символы / 3 и всегда 12 токенов ответа
+    estimated = sum(batch.estimate_job_tokens(batch.data_summary(store, day)) for day in dates)
+    assert 0 < stats.tokens < estimated
+    with results._connect() as conn:
+        assert conn.execute("SELECT SUM(tokens) FROM reports").fetchone()[0] == stats.tokens
+
+
+def test_batch_is_paced_by_requests_per_minute(fake_api):
+    accepted, store, dates, results = fake_api(days=6)
+    # 120 RPM: всплеск 2 запроса, дальше по одному каждые 0.5 с
+    run_batch(dates, store, results, workers=6, rpm=120, tpm=10_000_000)
+    assert len(accepted) == 6
+    assert accepted[-1] - accepted[0] >= 1.8
+    assert accepted[2] - accepted[0] >= 0.4
+
+
+def test_batch_is_paced_by_tokens_per_minute(fake_api):
+    accepted, store, dates, results = fake_api(days=4)
+    tokens = max(batch.estimate_job_tokens(batch.data_summary(store, day)) for day in dates)
+    # Лимит на один запрос в секунду по токенам, по числу запросов лимита нет
+    run_batch(dates, store, results, workers=4, rpm=6000, tpm=tokens * 60)
+    assert len(accepted) == 4
+    assert accepted[-1] - accepted[0] >= 2.7
+
+
+def test_interrupted_batch_saves_requests_in_flight(fake_api, monkeypatch):
+    accepted, store, dates, results = fake_api(latency=0.3, days=4)
+    completed = batch.as_completed
+
+    def interrupted(futures):
+        for future in completed(futures):
+            yield future
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(batch, "as_completed", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        run_batch(dates, store, results, workers=4, rpm=6000, tpm=10_000_000)
+    assert len(accepted) == 4
+    assert sorted(results.done()) == dates
+
+    monkeypatch.setattr(batch, "as_completed", completed)
+    stats = run_batch(dates, store, results, workers=4, rpm=6000, tpm=10_000_000)
+    assert (stats.done, stats.skipped) == (0, 4)
+    assert len(accepted) == 4
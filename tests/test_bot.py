@@ -0,0 +1,211 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+import config
+import dataset
+import storage
+import llm_cache
+import subscribers
+import deal_history
+from ingest import coerce_export_types
+from process_csv import Process
+from synthetic_export import generate_export
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    frame = generate_export(3000, days=20, end="2025-03-20 12:00:00", seed=5)
+    frame.loc[frame.index[::50], "responsible_user_id"] = "Муратова Рината"
+    path = str(tmp_path / "snapshot.parquet")
+    coerce_export_types(frame).to_parquet(path, index=False)
+    monkeypatch.setattr(bot, "SNAPSHOT_FILE", path)
+    monkeypatch.setattr(bot, "download_and_convert_xlsx", lambda: True)
+    monkeypatch.setattr(storage, "_store", None)
+    monkeypatch.setattr(dataset, "_dataset", None)
+    return path
+
+
+def backfill(path, db, streaming, monkeypatch):
+    store = storage.CumulativeStore(db, legacy_json=None)
+    monkeypatch.setattr(storage, "_store", store)
+    monkeypatch.setattr(dataset, "_dataset", dataset.Dataset(store, path))
+    monkeypatch.setattr(Process, "stream_daily_metrics", with_small_chunks(Process.stream_daily_metrics))
+    bot.generate_historical_data(streaming=streaming)
+    return store
+
+
+def with_small_chunks(stream):
+    return staticmethod(lambda path, chunksize=None, **kwargs: stream(path, 400, **kwargs))
+
+
+def test_streaming_backfill_stores_the_same_history(snapshot, tmp_path, monkeypatch):
+    in_memory = backfill(snapshot, str(tmp_path / "memory.db"), False, monkeypatch)
+    streamed = backfill(snapshot, str(tmp_path / "streamed.db"), True, monkeypatch)
+
+    assert len(in_memory.dates()) > 15
+    assert streamed.dates() == in_memory.dates()
+    assert streamed.entries() == in_memory.entries()
+    for kind in ("successful", "failed"):
+        assert streamed.deals(kind=kind) == in_memory.deals(kind=kind)
+
+
+def test_streaming_backfill_replaces_stored_deals(snapshot, tmp_path, monkeypatch):
+    db = str(tmp_path / "streamed.db")
+    first = backfill(snapshot, db, True, monkeypatch).deals()
+    assert backfill(snapshot, db, True, monkeypatch).deals() == first
+
+
+class FakeBot:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        if self.error:
+            raise self.error
+        self.sent.append((chat_id, text))
+
+
+class FakeOpenAI:
+    def __init__(self, error=None):
+        self.chat = SimpleNamespace(completions=self)
+        self.error = error
+        self.calls = []
+        self.options = {}
+
+    def with_options(self, **options):
+        self.options = options
+        return self
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error:
+            raise self.error
+        message = SimpleNamespace(content="Вывод: всё хорошо.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class BadRequest(Exception):
+    error_code = 400
+    description = "Bad Request: message is too long"
+
+
+@pytest.fixture
+def daily(tmp_path, monkeypatch):
+    """send_report_day on a snapshot with yesterday's deals; Telegram and OpenAI are fakes."""
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "snapshot.parquet")
+    coerce_export_types(generate_export(2000, days=10, end=datetime.now() - timedelta(hours=1))).to_parquet(path, index=False)
+    store = storage.CumulativeStore(str(tmp_path / "report.db"), legacy_json=None)
+    store.mark_completed((datetime.now() - timedelta(days=2)).strftime("%Y-%m-%d"))
+    registry = subscribers.SubscriberRegistry(str(tmp_path / "subscribers.db"))
+    registry.add(1)
+    monkeypatch.setattr(storage, "_store", store)
+    monkeypatch.setattr(dataset, "_dataset", dataset.Dataset(store, path))
+    monkeypatch.setattr(subscribers, "_registry", registry)
+    monkeypatch.setattr(deal_history, "_history", deal_history.DealHistory(str(tmp_path / "deal_history")))
+    monkeypatch.setattr(llm_cache, "_cache", None)
+    monkeypatch.setattr(config, "_openai_client", FakeOpenAI())
+    monkeypatch.setattr(bot, "download_and_convert_xlsx", lambda: True)
+    monkeypatch.setattr(bot, "_bot", FakeBot())
+    return SimpleNamespace(store=store, registry=registry, yesterday=(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"))
+
+
+def test_report_moves_the_checkpoint_once(daily):
+    bot.send_report_day()
+    assert daily.store.last_completed() == daily.yesterday
+    assert len(bot._bot.sent) == 1
+
+    bot.send_report_day()
+    assert len(bot._bot.sent) == 1
+
+
+def test_failed_refresh_keeps_the_checkpoint(daily, monkeypatch):
+    monkeypatch.setattr(bot, "download_and_convert_xlsx", lambda: False)
+    bot.send_report_day()
+    assert bot._bot.sent == []
+    assert daily.store.last_completed() < daily.yesterday
+    assert daily.store.get(daily.yesterday) is None
+
+
+def test_undelivered_report_is_sent_again(daily, monkeypatch):
+    monkeypatch.setattr(bot, "_bot", FakeBot(BadRequest()))
+    bot.send_report_day()
+    assert daily.store.last_completed() < daily.yesterday
+    assert daily.store.get(daily.yesterday) is not None
+    # 400 из-за самого сообщения не отписывает чат
+    assert daily.registry.chat_ids() == [1]
+
+    monkeypatch.setattr(bot, "_bot", FakeBot())
+    bot.send_report_day()
+    assert len(bot._bot.sent) == 1
+    assert daily.store.last_completed() == daily.yesterday
+
+
+def test_missed_report_is_sent_a_day_later(daily, monkeypatch):
+    monkeypatch.setattr(bot, "_bot", FakeBot(BadRequest()))
+    bot.send_report_day()
+    assert daily.store.last_completed() < daily.yesterday
+
+    # Следующий запуск — уже на другой день: уходят оба отчёта, по порядку
+    class Tomorrow(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(days=1)
+
+    monkeypatch.setattr(bot, "datetime", Tomorrow)
+    monkeypatch.setattr(bot, "_bot", FakeBot())
+    bot.send_report_day()
+    today = datetime.now().strftime("%Y-%m-%d")
+    assert daily.store.last_completed() == today
+    assert len(bot._bot.sent) == 2
+    assert [date for date in daily.store.dates() if date >= daily.yesterday] == [daily.yesterday, today]
+
+
+def test_report_days():
+    yesterday = datetime(2025, 3, 10)
+    assert bot.report_days(None, yesterday) == [yesterday]
+    assert bot.report_days("2025-03-08", yesterday) == [datetime(2025, 3, 9), yesterday]
+    # Не больше REPORT_RESEND_DAYS отчётов, старые дни догружаются без отправки
+    assert bot.report_days("2025-02-01", yesterday) == [datetime(2025, 3, 8), datetime(2025, 3, 9), yesterday]
+
+
+def chat_message(text):
+    return SimpleNamespace(chat=SimpleNamespace(id=7), text=text)
+
+
+@pytest.fixture
+def chat(daily):
+    daily.store.upsert([{"updated_at": daily.yesterday, "total_revenue": 125000.0, "margin": 25000.0,
+                         "deal_counts": {config.DEAL_STAGE_LABELS["successful"]: 3}}])
+    return daily
+
+
+def test_recognized_question_is_answered_without_the_llm(chat):
+    bot.handle_message(chat_message("Каким был оборот за вчера?"))
+    assert config._openai_client.calls == []
+    [(chat_id, text)] = bot._bot.sent
+    assert chat_id == 7 and "125 000" in text
+
+
+def test_other_questions_go_to_the_llm_with_the_chat_deadline(chat):
+    bot.handle_message(chat_message("Почему упали продажи?"))
+    assert bot._bot.sent == [(7, "Обрабатываю ваш запрос..."), (7, "Вывод: всё хорошо.")]
+    [call] = config._openai_client.calls
+    assert "Почему упали продажи?" in call["messages"][-1]["content"]
+    assert config._openai_client.options == {"timeout": config.CHAT_LLM_TIMEOUT, "max_retries": config.CHAT_LLM_RETRIES}
+
+
+def test_llm_failure_is_reported_to_the_chat(chat, monkeypatch):
+    monkeypatch.setattr(config, "_openai_client", FakeOpenAI(TimeoutError("deadline")))
+    bot.handle_message(chat_message("Почему упали продажи?"))
+    assert bot._bot.sent[-1] == (7, "Произошла ошибка. Пожалуйста, попробуйте еще раз.")
+
+
+def test_empty_history_is_not_sent_to_the_llm(daily):
+    bot.handle_message(chat_message("Почему упали продажи?"))
+    assert bot._bot.sent == [(7, "Данные временно недоступны. Попробуйте позже.")]
+    assert config._openai_client.calls == []
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from deal_history import DealHistory
+
+
+def table(statuses):
+    return pd.DataFrame({
+        "id": list(statuses),
+        "status_id": list(statuses.values()),
+        "responsible_user_id": ["Ким Виктор"] * len(statuses),
+        "price": [1000.0] * len(statuses),
+    })
+
+
+def test_time_in_stage(tmp_path):
+    history = DealHistory(str(tmp_path))
+    history.record("2025-03-01", table({1: "Новая", 2: "Новая"}))
+    history.record("2025-03-02", table({1: "Новая", 2: "Новая", 3: "Новая"}))
+    history.record("2025-03-05", table({1: "Успешно", 2: "Новая", 3: "Переговоры"}))
+    history.record("2025-03-06", table({1: "Успешно", 2: "Новая", 3: "Успешно"}))
+
+    # Сделки 1 и 2 были уже в первый день: дата входа в статус неизвестна
+    assert history.time_in_stage() == {
+        "Новая": {"count": 1, "mean_days": 3.0, "median_days": 3.0},
+        "Переговоры": {"count": 1, "mean_days": 1.0, "median_days": 1.0},
+    }
+    assert list(history.time_in_stage(start="2025-03-06")) == ["Переговоры"]
+
+
+def test_time_in_stage_before_first_recorded_day(tmp_path):
+    history = DealHistory(str(tmp_path))
+    assert history.time_in_stage() == {}
+    history.record("2025-03-01", table({1: "Новая"}))
+    assert history.time_in_stage(end="2025-02-01") == {}
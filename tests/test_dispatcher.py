@@ -0,0 +1,115 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from dispatcher import ChatDispatcher, QUEUE_FULL_TEXT, TIMEOUT_TEXT
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+def message(chat_id, text):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_dispatcher():
+    dispatchers = []
+
+    def make(handler, **kwargs):
+        dispatchers.append(ChatDispatcher(FakeBot(), handler, **kwargs))
+        return dispatchers[-1]
+
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.shutdown()
+
+
+def test_chats_run_in_parallel_and_each_in_order(make_dispatcher):
+    handled = []
+    # Первые сообщения обоих чатов ждут друг друга: пройдут, только если выполняются одновременно
+    barrier = threading.Barrier(2, timeout=5)
+
+    def handler(message):
+        if message.text.endswith("0"):
+            barrier.wait()
+        time.sleep(0.01)
+        handled.append((message.chat.id, message.text))
+
+    dispatcher = make_dispatcher(handler, max_workers=4)
+    for index in range(5):
+        for chat_id in (1, 2):
+            assert dispatcher.submit(message(chat_id, f"{chat_id}-{index}"))
+    wait_until(lambda: len(handled) == 10)
+
+    for chat_id in (1, 2):
+        assert [text for chat, text in handled if chat == chat_id] == [f"{chat_id}-{index}" for index in range(5)]
+    assert dispatcher.pending == 0
+    assert dispatcher.bot.sent == []
+
+
+def test_queue_full_is_answered(make_dispatcher):
+    release = threading.Event()
+    handled = []
+
+    def handler(message):
+        release.wait(5)
+        handled.append(message.text)
+
+    dispatcher = make_dispatcher(handler, max_workers=1, max_pending=2)
+    assert dispatcher.submit(message(1, "a"))
+    wait_until(lambda: dispatcher.pending == 0)
+    assert dispatcher.submit(message(1, "b"))
+    assert dispatcher.submit(message(2, "c"))
+    assert not dispatcher.submit(message(3, "d"))
+    assert dispatcher.bot.sent == [(3, QUEUE_FULL_TEXT)]
+
+    release.set()
+    wait_until(lambda: len(handled) == 3)
+    assert sorted(handled) == ["a", "b", "c"]
+
+
+def test_stale_messages_get_a_timeout_notice(make_dispatcher):
+    handled = []
+
+    def handler(message):
+        time.sleep(0.3)
+        handled.append(message.text)
+
+    dispatcher = make_dispatcher(handler, max_workers=2, queue_timeout=0.1)
+    dispatcher.submit(message(1, "first"))
+    dispatcher.submit(message(1, "second"))
+    wait_until(lambda: dispatcher.bot.sent)
+    wait_until(lambda: dispatcher.pending == 0 and handled)
+
+    assert handled == ["first"]
+    assert dispatcher.bot.sent == [(1, TIMEOUT_TEXT)]
+
+
+def test_handler_errors_do_not_block_the_chat(make_dispatcher):
+    handled = []
+
+    def handler(message):
+        if message.text == "boom":
+            raise RuntimeError("boom")
+        handled.append(message.text)
+
+    dispatcher = make_dispatcher(handler)
+    for text in ("a", "boom", "b"):
+        dispatcher.submit(message(1, text))
+    wait_until(lambda: len(handled) == 2)
+    assert handled == ["a", "b"]
@@ -0,0 +1,42 @@
+import requests
+
+import fanout
+from fanout import broadcast
+
+
+class TelegramError(Exception):
+    def __init__(self, error_code, retry_after=None):
+        super().__init__(f"Error code: {error_code}")
+        self.error_code = error_code
+        self.result_json = {"parameters": {"retry_after": retry_after}} if retry_after is not None else {}
+
+
+def test_only_429_is_retried(monkeypatch):
+    monkeypatch.setattr(fanout.time, "sleep", lambda seconds: None)
+    calls = []
+    errors = {1: [TelegramError(429, 0.01), None], 2: [requests.ReadTimeout("read timed out")], 3: [TelegramError(400)]}
+
+    def send(chat_id, text):
+        calls.append(chat_id)
+        error = errors[chat_id].pop(0)
+        if error:
+            raise error
+
+    results = broadcast(send, [1, 2, 3], "report", rate=1000, workers=1, retries=5)
+    assert results[1] is None
+    assert isinstance(results[2], requests.ReadTimeout)
+    assert results[3].error_code == 400
+    assert sorted(calls) == [1, 1, 2, 3]
+
+
+def test_429_retries_are_bounded(monkeypatch):
+    monkeypatch.setattr(fanout.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def send(chat_id, text):
+        calls.append(chat_id)
+        raise TelegramError(429, 0.01)
+
+    results = broadcast(send, [1], "report", rate=1000, retries=2)
+    assert results[1].error_code == 429
+    assert calls == [1, 1, 1]
@@ -0,0 +1,94 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import transport
+from ingest import refresh_snapshot, load_snapshot
+from synthetic_export import generate_export
+
+
+def xlsx(frame):
+    # Первая строка выгрузки amoCRM — служебная, read_export её отбрасывает
+    buffer = io.BytesIO()
+    pd.concat([frame.head(1), frame]).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+class ExportServer:
+    """Serves one export body with an ETag and answers 304 to a matching If-None-Match."""
+
+    def __init__(self):
+        self.body, self.etag = b"", None
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(server.body)))
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/export.xlsx"
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def publish(self, frame, etag):
+        self.body, self.etag = xlsx(frame), etag
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(transport, "_breakers", {})
+    server = ExportServer()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        "snapshot_path": str(tmp_path / "snapshot.parquet"),
+        "meta_path": str(tmp_path / "snapshot.json"),
+        "temp_path": str(tmp_path / "export.xlsx"),
+    }
+
+
+def test_unchanged_export_is_not_downloaded_again(server, paths):
+    server.publish(generate_export(200, seed=1), '"v1"')
+    first = refresh_snapshot(server.url, **paths)
+    assert len(first) == 200
+
+    assert refresh_snapshot(server.url, **paths) is None
+    assert server.requests[-1].get("If-None-Match") == '"v1"'
+    pd.testing.assert_frame_equal(load_snapshot(paths["snapshot_path"]), first)
+
+
+def test_changed_export_replaces_the_snapshot(server, paths):
+    export = generate_export(200, seed=1)
+    server.publish(export, '"v1"')
+    refresh_snapshot(server.url, **paths)
+
+    export.loc[5, "price"] = "1,000"
+    export.loc[5, "updated_at"] = "01.01.2030 10:00:00"
+    server.publish(export.drop(index=7), '"v2"')
+    snapshot = refresh_snapshot(server.url, **paths)
+
+    assert server.requests[-1].get("If-None-Match") == '"v1"'
+    assert len(snapshot) == 199
+    assert snapshot.set_index("id").loc[export.loc[5, "id"], "price"] == 1000.0
+    assert export.loc[7, "id"] not in set(snapshot["id"])
+    pd.testing.assert_frame_equal(load_snapshot(paths["snapshot_path"]), snapshot)
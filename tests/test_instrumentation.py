@@ -0,0 +1,86 @@
+import os
+import logging
+
+import pytest
+
+import cli
+import instrumentation
+from instrumentation import increment, profiled, render_prometheus, span, timed, write_metrics_file
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(instrumentation, "_spans", {})
+    monkeypatch.setattr(instrumentation, "_counters", {})
+
+
+def test_span_and_timed_count_runs_and_errors():
+    with span("load"):
+        pass
+
+    @timed("load")
+    def fail():
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        fail()
+    spans, _ = instrumentation.snapshot()
+    assert spans["load"]["count"] == 2
+    assert spans["load"]["errors"] == 1
+    assert spans["load"]["max_seconds"] >= spans["load"]["last_seconds"] >= 0
+
+
+def test_render_prometheus():
+    with span("report"):
+        pass
+    increment("llm_requests_total", model="gpt-4", cached="false")
+    increment("llm_requests_total", 2, model="gpt-4", cached="false")
+    increment("batch.done")
+    text = render_prometheus()
+    lines = text.splitlines()
+    assert 'huber_stage_runs_total{stage="report"} 1' in lines
+    assert 'huber_stage_errors_total{stage="report"} 0' in lines
+    assert 'huber_llm_requests_total{cached="false",model="gpt-4"} 3' in lines
+    assert "huber_batch.done 1" in lines
+    assert text.endswith("\n")
+
+
+def test_label_values_are_escaped():
+    increment("errors", service='bad "quoted"\\path\nnext')
+    assert 'huber_errors{service="bad \\"quoted\\"\\\\path\\nnext"} 1' in render_prometheus().splitlines()
+
+
+def test_write_metrics_file(tmp_path):
+    increment("batch.done")
+    path = tmp_path / "metrics" / "huber.prom"
+    write_metrics_file(str(path))
+    assert path.read_text(encoding="utf-8") == render_prometheus()
+    assert os.listdir(path.parent) == ["huber.prom"]
+
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+
+def test_profiled_saves_and_logs_the_profile(tmp_path, caplog, capsys):
+    with caplog.at_level(logging.INFO), profiled("job", str(tmp_path)):
+        busy()
+    files = os.listdir(tmp_path)
+    assert len(files) == 1 and files[0].startswith("job-") and files[0].endswith(".prof")
+    assert "cumulative" in caplog.text and "busy" in caplog.text
+    assert capsys.readouterr().out == ""
+
+
+def test_profiled_is_off_without_a_directory(tmp_path, monkeypatch):
+    monkeypatch.delenv("HUBER_PROFILE_DIR", raising=False)
+    with profiled("job"):
+        busy()
+    with profiled("outer", str(tmp_path)), profiled("inner", str(tmp_path)):
+        busy()
+    assert [name.split("-")[0] for name in os.listdir(tmp_path)] == ["outer"]
+
+
+def test_cli_profiles_any_subcommand(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "run_report", lambda args: busy() and None)
+    assert cli.main(["--profile", str(tmp_path), "report"]) == 0
+    assert [name.split("-")[0] for name in os.listdir(tmp_path)] == ["report"]
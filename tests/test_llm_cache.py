@@ -0,0 +1,116 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache
+from storage import CumulativeStore
+
+MESSAGES = [{"role": "user", "content": "Сколько  сделок за вчера?"}]
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=f" ответ {self.calls} ")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path / "llm_cache.db"), ttl=3600, max_entries=3)
+    monkeypatch.setattr(llm_cache, "_cache", cache)
+    return cache
+
+
+def ask(cache, client, question="Сколько сделок за вчера?", version=""):
+    return cache.complete(client, "gpt-4", [{"role": "user", "content": question}], data_version=version)
+
+
+def test_hits_and_misses_are_counted(cache):
+    client = FakeOpenAI()
+    assert ask(cache, client) == "ответ 1"
+    # Регистр и пробелы не меняют ключ
+    assert cache.complete(client, "gpt-4", MESSAGES) == "ответ 1"
+    assert ask(cache, client, "Другой вопрос") == "ответ 2"
+    assert client.calls == 2
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 2}
+
+
+def test_params_and_model_are_part_of_the_key(cache):
+    client = FakeOpenAI()
+    cache.complete(client, "gpt-4", MESSAGES, max_tokens=100)
+    cache.complete(client, "gpt-4", MESSAGES, max_tokens=200)
+    cache.complete(client, "gpt-4o", MESSAGES, max_tokens=100)
+    assert client.calls == 3
+
+
+def test_expired_entries_are_recomputed(cache, monkeypatch):
+    client = FakeOpenAI()
+    ask(cache, client)
+    now = time.time()
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now + cache.ttl + 1)
+    assert ask(cache, client) == "ответ 2"
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(cache, monkeypatch):
+    client = FakeOpenAI()
+    clock = iter(range(1_000_000, 2_000_000))
+    monkeypatch.setattr(llm_cache.time, "time", lambda: float(next(clock)))
+    for question in ("a", "b", "c"):
+        ask(cache, client, question)
+    ask(cache, client, "a")
+    ask(cache, client, "d")
+    assert cache.stats()["entries"] == 3
+    calls = client.calls
+    ask(cache, client, "a")
+    ask(cache, client, "c")
+    ask(cache, client, "d")
+    assert client.calls == calls
+    ask(cache, client, "b")
+    assert client.calls == calls + 1
+
+
+def test_new_data_version_drops_older_answers(cache):
+    client = FakeOpenAI()
+    ask(cache, client, "a", version="db:1")
+    ask(cache, client, "b")
+    ask(cache, client, "a", version="db:2")
+    assert client.calls == 3
+    # Ответы без версии данных не зависят от истории и остаются
+    assert cache.stats()["entries"] == 2
+    ask(cache, client, "b")
+    assert client.calls == 3
+
+
+def test_store_write_invalidates_the_cache(cache, tmp_path):
+    client = FakeOpenAI()
+    store = CumulativeStore(str(tmp_path / "report.db"), legacy_json=None)
+    assert store.version() == ""
+    store.upsert([{"updated_at": "2025-01-01", "total_revenue": 100.0}])
+    first = store.version()
+    ask(cache, client, version=first)
+    store.upsert([{"updated_at": "2025-01-02", "total_revenue": 200.0}])
+    assert store.version() != first
+    assert cache.stats()["entries"] == 0
+    ask(cache, client, version=store.version())
+    assert client.calls == 2
+
+
+def test_rebuilt_store_does_not_reuse_old_answers(cache, tmp_path):
+    client = FakeOpenAI()
+    old = CumulativeStore(str(tmp_path / "old.db"), legacy_json=None)
+    old.upsert([{"updated_at": "2025-01-01", "total_revenue": 100.0}])
+    ask(cache, client, version=old.version())
+    # Новая база начинает счётчик заново, но версия у неё своя
+    rebuilt = CumulativeStore(str(tmp_path / "rebuilt.db"), legacy_json=None)
+    rebuilt.upsert([{"updated_at": "2025-01-01", "total_revenue": 999.0}])
+    assert rebuilt.version() != old.version()
+    assert ask(cache, client, version=rebuilt.version()) == "ответ 2"
@@ -0,0 +1,74 @@
+import pytest
+
+from config import DEAL_STATUSES, convert_to_python_types
+from process_csv import Process
+from synthetic_export import generate_export
+
+
+@pytest.fixture(scope="module")
+def export(tmp_path_factory):
+    """Synthetic export with excluded users, "Биржа заявок" and unparsable dates."""
+    frame = generate_export(3000, days=20, end="2025-03-20 12:00:00", seed=3)
+    frame.loc[frame.index[::50], "responsible_user_id"] = "Муратова Рината"
+    frame.loc[frame.index[::97], "updated_at"] = "не указано"
+    path = tmp_path_factory.mktemp("export") / "export.csv"
+    frame.to_csv(path, index=False, encoding="utf-8")
+    return str(path)
+
+
+def load(path):
+    deals = Process.load_deal_frame(Process.read_csv_file(path))
+    return deals[deals["date"].notna() & (deals["responsible_user_id"] != "Муратова Рината")]
+
+
+def per_day_entries(deals):
+    """The per-day path: every metric computed on the day's frame without "Биржа заявок"."""
+    entries = []
+    for date in deals["date"].unique():
+        day = deals[deals["date"] == date]
+        work = day[day["responsible_user_id"] != "Биржа заявок"]
+        total_revenue, margin = Process.calculate_total_revenue(work)
+        entries.append(convert_to_python_types({
+            "updated_at": date.strftime("%Y-%m-%d"),
+            "total_revenue": total_revenue,
+            "margin": margin,
+            "total_revenue_per_employee": Process.calculate_revenue_per_employee(work),
+            "deal_counts": Process.count_deal_stages(work),
+            "employee_activity": Process.calculate_employee_activity(work),
+            "deals": {
+                "successful": Process.get_deals_records(day, DEAL_STATUSES["successful"]),
+                "failed": Process.get_deals_records(day, DEAL_STATUSES["failed"]),
+            },
+        }))
+    return entries
+
+
+def test_daily_metrics_match_per_day_path(export):
+    deals = load(export)
+    expected = per_day_entries(deals)
+    assert len(expected) > 15
+    assert convert_to_python_types(Process.calculate_daily_metrics(deals)) == expected
+
+
+@pytest.mark.parametrize("chunksize", [250, 1000, 10_000])
+def test_streaming_matches_in_memory(export, chunksize):
+    expected = convert_to_python_types(Process.calculate_daily_metrics(load(export)))
+    streamed = Process.stream_daily_metrics(export, chunksize=chunksize, exclude_users=("Муратова Рината",))
+    assert convert_to_python_types(streamed) == expected
+
+
+def test_streaming_hands_out_deals_per_date(export):
+    expected = Process.calculate_daily_metrics(load(export))
+    calls = []
+    streamed = Process.stream_daily_metrics(export, chunksize=500, exclude_users=("Муратова Рината",),
+                                            keep_deals=False, on_deals=lambda date, kinds: calls.append((date, kinds)))
+    assert all("deals" not in entry for entry in streamed)
+
+    collected = {}
+    for date, kinds in calls:
+        day = collected.setdefault(date.strftime("%Y-%m-%d"), {"successful": [], "failed": []})
+        for kind, records in kinds.items():
+            day[kind].extend(records)
+    assert len(calls) > len(collected)
+    assert convert_to_python_types(collected) == convert_to_python_types(
+        {entry["updated_at"]: entry["deals"] for entry in expected})
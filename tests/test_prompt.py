@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+import pytest
+
+from config import DEAL_STAGE_LABELS, TAKEN_KEY, CLOSED_FAILED_KEY
+from prompt import build_history_data, estimate_tokens, render_history
+
+EMPLOYEES = ["Иванов Иван", "Ким Виктор", "Петрова Анна"]
+
+
+def history(days=120):
+    start = date(2024, 9, 1)
+    return [
+        {
+            "updated_at": (start + timedelta(days=i)).isoformat(),
+            "total_revenue": 1000.0 * i,
+            "margin": 200.0 * i,
+            "total_revenue_per_employee": {employee: 100.0 * (i + k) for k, employee in enumerate(EMPLOYEES)},
+            "deal_counts": {label: i % 5 for label in DEAL_STAGE_LABELS.values()},
+            "employee_activity": {employee: {TAKEN_KEY: i % 4, CLOSED_FAILED_KEY: i % 2} for employee in EMPLOYEES},
+        }
+        for i in range(days)
+    ]
+
+
+@pytest.mark.parametrize("level", [0, 1, 2, 3])
+def test_each_level_is_used_when_it_is_the_first_to_fit(level):
+    entries = history()
+    budget = estimate_tokens(render_history(entries, level))
+    data = build_history_data(entries, budget)
+    assert (data.level, data.days) == (level, len(entries))
+    assert data.tokens <= budget
+    assert data.text.startswith("Период данных: 2024-09-01..2024-12-29 (120 дн.).\n")
+    assert "не поместились" not in data.text
+
+
+def test_levels_get_shorter():
+    entries = history()
+    tokens = [estimate_tokens(render_history(entries, level)) for level in range(4)]
+    assert tokens == sorted(tokens, reverse=True)
+    assert len(set(tokens)) == 4
+
+
+def test_levels_group_older_days():
+    entries = history()
+    assert "Сотрудники по дням" in render_history(entries, 0)
+    assert "Сотрудники за весь период" in render_history(entries, 1)
+    assert "\n2024-09-02..2024-09-08|" in render_history(entries, 2)
+    assert "\n2024-09-01..2024-09-30|" in render_history(entries, 3)
+    # Последние дни остаются по дням на любом уровне
+    assert "\n2024-12-29|" in render_history(entries, 3)
+
+
+def test_dropped_months_are_named_in_the_prompt():
+    entries = history(400)
+    kept = [entry for entry in entries if entry["updated_at"] >= "2024-12-01"]
+    budget = estimate_tokens(render_history(kept, 3, entries[0]["updated_at"]))
+    assert budget < estimate_tokens(render_history(entries, 3))
+    data = build_history_data(entries, budget)
+    assert (data.level, data.days) == (3, len(kept))
+    assert data.text.startswith("Период данных: 2024-12-01..2025-10-05 (309 дн.). История начинается с 2024-09-01, "
+                                "но дни до 2024-12-01 не поместились в запрос и опущены")
+    assert "за всё время" in data.text
+    assert "2024-11-" not in data.text.split("\n", 1)[1]
+
+
+def test_tiny_budget_keeps_the_last_day():
+    data = build_history_data(history(), 10)
+    assert data.days == 1
+    assert data.text.startswith("Период данных: 2024-12-29..2024-12-29 (1 дн.). История начинается с 2024-09-01")
+
+
+def test_empty_history():
+    data = build_history_data([])
+    assert (data.text, data.days) == ("Нет данных.", 0)
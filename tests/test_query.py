@@ -0,0 +1,80 @@
+from datetime import date
+
+import pytest
+
+from query import History, answer_intent, parse_question
+
+TODAY = date(2025, 4, 10)
+EMPLOYEES = ["Ким Виктор", "Иванов Иван", "Петрова Анна", "Сидорова Ирина"]
+
+
+@pytest.mark.parametrize("question, metric, start, end", [
+    ("сколько сделок за март", "deals", date(2025, 3, 1), date(2025, 3, 31)),
+    ("количество сделок за неделю", "deals", date(2025, 4, 3), date(2025, 4, 9)),
+    ("кто лучший сотрудник за март", "ranking", date(2025, 3, 1), date(2025, 3, 31)),
+    ("выручка за 01.03.2025 - 2025-03-05", "revenue", date(2025, 3, 1), date(2025, 3, 5)),
+    ("Сколько нереализованных сделок за вчера?", "failed", date(2025, 4, 9), date(2025, 4, 9)),
+    ("сколько сделок не реализовано за вчера", "failed", date(2025, 4, 9), date(2025, 4, 9)),
+    ("сколько неуспешных сделок за март", "failed", date(2025, 3, 1), date(2025, 3, 31)),
+    ("сколько реализованных сделок за вчера", "successful", date(2025, 4, 9), date(2025, 4, 9)),
+    ("сумма успешных сделок за март", "successful_sum", date(2025, 3, 1), date(2025, 3, 31)),
+    ("какая сумма реализованных сделок за неделю", "successful_sum", date(2025, 4, 3), date(2025, 4, 9)),
+    ("на какую сумму продали за март", "revenue", date(2025, 3, 1), date(2025, 3, 31)),
+    ("сколько сделок в работе за вчера", "in_progress", date(2025, 4, 9), date(2025, 4, 9)),
+])
+def test_parse_question(question, metric, start, end):
+    intent = parse_question(question, EMPLOYEES, TODAY)
+    assert (intent.metric, intent.start, intent.end, intent.employee) == (metric, start, end, None)
+
+
+@pytest.mark.parametrize("question, employee", [
+    ("Каким был оборот за вчера?", None),
+    ("выручка Иванова за март", "Иванов Иван"),
+    ("сколько взяла Петрова за неделю", "Петрова Анна"),
+    ("активность Ким за вчера", "Ким Виктор"),
+    ("выручка Ирины за март", "Сидорова Ирина"),
+    ("сколько сделок у Ирине за март", "Сидорова Ирина"),
+    ("выручка Сидоровой за март", "Сидорова Ирина"),
+])
+def test_employees_match_whole_words(question, employee):
+    assert parse_question(question, EMPLOYEES, TODAY).employee == employee
+
+
+def test_invalid_iso_date_is_skipped():
+    assert parse_question("выручка за 2025-02-30", EMPLOYEES, TODAY) is None
+    assert parse_question("выручка за 2025-02-30 и 2025-03-02", EMPLOYEES, TODAY).start == date(2025, 3, 2)
+
+
+def activity(taken):
+    return {"Количество сделок, взятые в работу сотрудником": taken, "Закрытая и Нереализованная сделка": 0}
+
+
+def test_best_employee_is_ranked_by_successful_deals():
+    entries = [{
+        "updated_at": "2025-03-03",
+        "total_revenue_per_employee": {"Ким Виктор": 300.0, "Иванов Иван": 900.0},
+        "employee_activity": {"Ким Виктор": activity(3), "Иванов Иван": activity(1), "Петрова Анна": activity(2)},
+    }]
+    successful = {"responsible_user_id": ["Ким Виктор", "Ким Виктор", "Иванов Иван", "Биржа заявок"],
+                  "price": [100.0, 200.0, 900.0, 5000.0]}
+    history = History(entries, deals=lambda columns, start, end, kind: successful)
+
+    answer = answer_intent(parse_question("кто лучший сотрудник за март", EMPLOYEES, TODAY), history)
+    lines = answer.splitlines()
+    assert lines[1].startswith("1. Ким Виктор: успешных сделок — 2")
+    assert lines[2].startswith("2. Иванов Иван: успешных сделок — 1")
+    assert lines[3].startswith("3. Петрова Анна: успешных сделок — 0")
+    assert "Лучший: Ким Виктор" in lines
+    assert "Худший: Петрова Анна" in lines
+    assert "Биржа заявок" not in answer
+
+
+def test_successful_sum_counts_only_successful_deals():
+    successful = {"responsible_user_id": ["Ким Виктор", "Иванов Иван", "Биржа заявок"], "price": [100.0, 250.0, 5000.0]}
+    history = History([{"updated_at": "2025-03-03", "total_revenue": 99999.0}],
+                      deals=lambda columns, start, end, kind: successful if kind == "successful" else None)
+
+    answer = answer_intent(parse_question("сумма успешных сделок за март", EMPLOYEES, TODAY), history)
+    assert answer == "Сумма успешных сделок за 03.03.2025: 350 тенге (сделок: 2)."
+    answer = answer_intent(parse_question("сумма успешных сделок Кима за март", EMPLOYEES, TODAY), history)
+    assert answer == "Сумма успешных сделок сотрудника Ким Виктор за 03.03.2025: 100 тенге (сделок: 1)."
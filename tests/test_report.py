@@ -0,0 +1,84 @@
+import pytest
+
+from config import DEAL_STAGE_LABELS, TAKEN_KEY, CLOSED_FAILED_KEY
+from report import compute_report_metrics, rank_employees, render_report
+
+
+def summary(employees, date="2025-02-26"):
+    """Data summary with {name: (successful deals, their sum, taken)}."""
+    return {
+        "date": date,
+        "total_revenue": sum(total for _, total, _ in employees.values()),
+        "deal_counts": {DEAL_STAGE_LABELS["successful"]: sum(count for count, _, _ in employees.values()),
+                        DEAL_STAGE_LABELS["failed"]: 1, DEAL_STAGE_LABELS["in_progress"]: 2},
+        "employee_activity": {name: {TAKEN_KEY: taken, CLOSED_FAILED_KEY: 0}
+                              for name, (_, _, taken) in employees.items()},
+        "successful_deals": {name: {"successful_deals": count, "price": total}
+                             for name, (count, total, _) in employees.items()},
+    }
+
+
+@pytest.mark.parametrize("scores, expected", [
+    ({}, ([], [], False)),
+    ({"Анна": (2, 100.0)}, (["Анна"], [], False)),
+    ({"Анна": (2, 100.0), "Иван": (2, 100.0), "Ким": (2, 100.0)}, ([], [], True)),
+    # Сначала число успешных сделок, при равенстве — их сумма
+    ({"Анна": (3, 10.0), "Иван": (2, 900.0), "Ким": (2, 50.0)}, (["Анна"], ["Ким"], False)),
+    ({"Анна": (3, 10.0), "Иван": (3, 10.0), "Ким": (1, 0.0), "Оля": (1, 0.0)},
+     (["Анна", "Иван"], ["Ким", "Оля"], False)),
+])
+def test_rank_employees(scores, expected):
+    assert rank_employees(scores) == expected
+
+
+def test_single_employee_is_best_and_never_worst():
+    metrics = compute_report_metrics(summary({"Анна": (2, 500.0, 4)}))
+    assert (metrics["best"], metrics["worst"], metrics["all_equal"]) == (["Анна"], [], False)
+    text = render_report(metrics)
+    assert "Лучший сотрудник: Анна (успешных сделок: 2, сумма: 500 тенге); худшего сотрудника нет" in text
+
+
+def test_all_equal_employees_have_no_best_or_worst():
+    metrics = compute_report_metrics(summary({"Анна": (1, 100.0, 2), "Иван": (1, 100.0, 2)}))
+    assert (metrics["best"], metrics["worst"], metrics["all_equal"]) == ([], [], True)
+    text = render_report(metrics)
+    assert "Все сотрудники показали одинаковые результаты: Анна" in text
+    assert "Лучший" not in text and "худший" not in text
+
+
+def test_ties_at_the_top_and_bottom_list_every_employee():
+    metrics = compute_report_metrics(summary({
+        "Анна": (3, 300.0, 3), "Иван": (3, 300.0, 6), "Ким": (0, 0.0, 1), "Оля": (0, 0.0, 2),
+    }))
+    assert metrics["best"] == ["Анна", "Иван"]
+    assert metrics["worst"] == ["Ким", "Оля"]
+    text = render_report(metrics)
+    assert "Лучший сотрудник: Анна (успешных сделок: 3, сумма: 300 тенге), Иван" in text
+    assert "худший сотрудник: Ким (успешных сделок: 0, сумма: 0 тенге), Оля" in text
+
+
+def test_efficiency_is_successful_over_taken():
+    metrics = compute_report_metrics(summary({"Анна": (1, 100.0, 3), "Иван": (2, 100.0, 0)}))
+    assert metrics["employees"]["Анна"]["efficiency"] == pytest.approx(100 / 3)
+    # Ничего не взято в работу — эффективность не считается, деления на ноль нет
+    assert metrics["employees"]["Иван"]["efficiency"] is None
+    text = render_report(metrics)
+    assert "   - Анна: 33.3% (1 из 3)" in text
+    assert "   - Иван: нет взятых сделок" in text
+
+
+def test_report_numbers_are_computed_locally():
+    metrics = compute_report_metrics(summary({"Анна": (2, 1_500_000.0, 4)}))
+    assert (metrics["successful"], metrics["failed"], metrics["in_progress"]) == (2, 1, 2)
+    assert metrics["margin"] == pytest.approx(300_000.0)
+    text = render_report(metrics)
+    assert text.startswith("Отчёт за 26 февраля 2025 года\n1. Общий оборот отдела продаж: 1 500 000 тенге (продаж: 2)")
+    assert "2. Маржинальность 20%: оборот 1 500 000 тенге, прибыль 300 000 тенге" in text
+
+
+def test_report_without_employees():
+    metrics = compute_report_metrics(summary({}, date=None))
+    text = render_report(metrics)
+    assert text.startswith("Отчёт за день")
+    assert "нет данных по сотрудникам" in text
+    assert "   - нет активности" in text
@@ -0,0 +1,93 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from storage import CumulativeStore, metric_vector, period_start, ROLLUP_REBUILD_DAYS
+
+EMPLOYEES = ["Иванов Иван", "Ким Виктор", "Петрова Анна"]
+
+
+def make_entry(day, rng):
+    employees = rng.sample(EMPLOYEES, rng.randint(1, len(EMPLOYEES)))
+    revenue = {employee: float(rng.randint(0, 500) * 100) for employee in employees}
+    return {
+        "updated_at": day,
+        "total_revenue": sum(revenue.values()),
+        "margin": sum(revenue.values()) * 0.3,
+        "total_revenue_per_employee": revenue,
+        "deal_counts": {"Успешные сделки": rng.randint(0, 9), "Проваленные сделки": rng.randint(0, 9),
+                        "Сделки в работе": rng.randint(0, 9)},
+        "employee_activity": {
+            employee: {"Количество сделок, взятые в работу сотрудником": rng.randint(0, 5),
+                       "Закрытая и Нереализованная сделка": rng.randint(0, 3)}
+            for employee in employees
+        },
+    }
+
+
+def brute_total(entries, metric, start, end, employee=""):
+    return sum(metric_vector(entry).get((metric, employee), 0.0)
+               for entry in entries.values() if start <= entry["updated_at"] <= end)
+
+
+def brute_rollups(entries, period, metric, employee=""):
+    totals = {}
+    for entry in entries.values():
+        value = metric_vector(entry).get((metric, employee), 0.0)
+        if value:
+            start = period_start(entry["updated_at"], period)
+            totals[start] = totals.get(start, 0.0) + value
+    return totals
+
+
+def check_against_brute_force(store, entries, rng):
+    dates = sorted(entries)
+    series = [("days", ""), ("total_revenue", ""), ("successful", ""), ("in_progress", "")]
+    series += [(metric, employee) for employee in EMPLOYEES for metric in ("revenue", "taken", "closed_failed")]
+    for _ in range(50):
+        start, end = sorted(rng.sample(dates, 2))
+        for metric, employee in series:
+            assert store.range_total(metric, start, end, employee) == pytest.approx(
+                brute_total(entries, metric, start, end, employee))
+    for period in ("week", "month"):
+        for metric, employee in series:
+            stored = {start: value for start, value in store.rollups(period, metric, employee=employee) if value}
+            assert stored == pytest.approx(brute_rollups(entries, period, metric, employee))
+
+
+@pytest.mark.parametrize("batch", [1, 5, ROLLUP_REBUILD_DAYS + 10])
+def test_prefix_sums_match_brute_force(tmp_path, batch):
+    """Shuffled days and replaced days, one upsert per `batch` entries (incremental and rebuild paths)."""
+    rng = random.Random(batch)
+    first = date(2025, 1, 1)
+    days = [(first + timedelta(days=offset)).isoformat() for offset in range(90)]
+    updates = [make_entry(day, rng) for day in days] + [make_entry(rng.choice(days), rng) for _ in range(30)]
+    rng.shuffle(updates)
+
+    store = CumulativeStore(str(tmp_path / "report.db"), legacy_json=None)
+    entries = {}
+    for offset in range(0, len(updates), batch):
+        chunk = updates[offset:offset + batch]
+        store.upsert([dict(entry) for entry in chunk])
+        entries.update({entry["updated_at"]: entry for entry in chunk})
+
+    check_against_brute_force(store, entries, rng)
+
+
+def test_rollups_rebuilt_for_existing_history(tmp_path):
+    rng = random.Random(7)
+    first = date(2025, 3, 1)
+    entries = {}
+    path = str(tmp_path / "report.db")
+    store = CumulativeStore(path, legacy_json=None)
+    for offset in range(20):
+        entry = make_entry((first + timedelta(days=offset)).isoformat(), rng)
+        entries[entry["updated_at"]] = entry
+        store.upsert([dict(entry)])
+    with store._connect() as conn:
+        conn.execute("DELETE FROM meta WHERE key = 'rollups_built'")
+        conn.execute("DELETE FROM daily_metrics")
+        conn.execute("DELETE FROM rollups")
+
+    check_against_brute_force(CumulativeStore(path, legacy_json=None), entries, rng)
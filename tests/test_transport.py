@@ -0,0 +1,185 @@
+import time
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import transport
+from transport import CircuitBreaker, CircuitOpenError
+
+
+class StandIn:
+    """Local HTTP server answering with scripted statuses (the last one repeats)."""
+
+    def __init__(self, statuses=(200,), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_one(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                stand_in.requests.append(self.command)
+                status = stand_in.statuses.pop(0) if len(stand_in.statuses) > 1 else stand_in.statuses[0]
+                time.sleep(stand_in.delay)
+                self.send_response(status)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            do_GET = do_POST = handle_one
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/bot/sendMessage"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(*args, **kwargs):
+        servers.append(StandIn(*args, **kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(transport, "backoff_delay", lambda attempt: delays.append(attempt) or 0)
+    monkeypatch.setattr(transport, "_breakers", {})
+    return delays
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/"
+
+
+def test_5xx_is_retried_until_success(stand_in):
+    server = stand_in([503, 502, 200])
+    response = transport.request("test", "GET", server.url, retries=3)
+    assert response.status_code == 200
+    assert len(server.requests) == 3
+
+
+def test_last_5xx_response_is_returned(stand_in):
+    server = stand_in([500])
+    response = transport.request("test", "GET", server.url, retries=2)
+    assert response.status_code == 500
+    assert len(server.requests) == 3
+
+
+def test_4xx_is_not_retried(stand_in):
+    server = stand_in([429])
+    assert transport.request("test", "POST", server.url, retries=3).status_code == 429
+    assert len(server.requests) == 1
+
+
+def test_post_is_retried_on_5xx(stand_in):
+    server = stand_in([502, 200])
+    assert transport.request("test", "POST", server.url, retries=3).status_code == 200
+    assert server.requests == ["POST", "POST"]
+
+
+def test_post_is_not_repeated_after_read_timeout(stand_in):
+    server = stand_in([200], delay=0.5)
+    with pytest.raises(requests.ReadTimeout):
+        transport.request("test", "POST", server.url, retries=3, timeout=0.1)
+    time.sleep(0.5)
+    assert server.requests == ["POST"]
+
+
+def test_get_is_retried_after_read_timeout(stand_in):
+    server = stand_in([200], delay=0.3)
+    with pytest.raises(requests.ReadTimeout):
+        transport.request("test", "GET", server.url, retries=2, timeout=0.1)
+    time.sleep(0.3)
+    assert len(server.requests) == 3
+
+
+def test_post_is_retried_when_connection_failed(no_backoff):
+    with pytest.raises(requests.ConnectionError):
+        transport.request("test", "POST", closed_port_url(), retries=2)
+    assert no_backoff == [0, 1]
+
+
+def test_breaker_opens_after_consecutive_failures(stand_in):
+    server = stand_in([500])
+    transport._breakers["test"] = CircuitBreaker("test", failures=3, reset=60)
+    for _ in range(3):
+        assert transport.request("test", "GET", server.url, retries=0).status_code == 500
+    assert transport.get_breaker("test").state == "open"
+    with pytest.raises(CircuitOpenError):
+        transport.request("test", "GET", server.url, retries=0)
+    assert len(server.requests) == 3
+
+
+def test_breaker_half_open_trial_closes_it(stand_in):
+    server = stand_in([500, 200])
+    transport._breakers["test"] = CircuitBreaker("test", failures=1, reset=0.2)
+    transport.request("test", "GET", server.url, retries=0)
+    with pytest.raises(CircuitOpenError):
+        transport.request("test", "GET", server.url, retries=0)
+    time.sleep(0.25)
+    assert transport.get_breaker("test").state == "half_open"
+    assert transport.request("test", "GET", server.url, retries=0).status_code == 200
+    assert transport.get_breaker("test").state == "closed"
+
+
+def test_telegram_sender_goes_through_the_breaker(stand_in):
+    server = stand_in([200])
+    transport._breakers["telegram"] = CircuitBreaker("telegram", failures=1, reset=60)
+    transport._breakers["telegram"].record_failure()
+    with pytest.raises(CircuitOpenError):
+        transport.telegram_request_sender("post", server.url, timeout=5)
+    assert server.requests == []
+
+
+
+def broken(*args, **kwargs):
+    raise ValueError("bad header")
+
+
+def test_breaker_trial_with_a_local_error_does_not_stay_open(stand_in, monkeypatch):
+    server = stand_in([500, 200])
+    transport._breakers["test"] = CircuitBreaker("test", failures=1, reset=0.1)
+    transport.request("test", "GET", server.url, retries=0)
+    time.sleep(0.15)
+    with monkeypatch.context() as patch:
+        patch.setattr(transport.get_session(), "request", broken)
+        with pytest.raises(ValueError):
+            transport.request("test", "GET", server.url, retries=0)
+    assert transport.request("test", "GET", server.url, retries=0).status_code == 200
+
+
+def test_openai_transport_trial_with_a_local_error(stand_in, monkeypatch):
+    import httpx
+
+    server = stand_in([500, 200])
+    transport._breakers["openai-test"] = CircuitBreaker("openai-test", failures=1, reset=0.1)
+    client = transport.openai_http_client("openai-test")
+    assert client.get(server.url).status_code == 500
+    time.sleep(0.15)
+    with monkeypatch.context() as patch:
+        patch.setattr(httpx.HTTPTransport, "handle_request", broken)
+        with pytest.raises(ValueError):
+            client.get(server.url)
+    assert client.get(server.url).status_code == 200